@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+CACHE_SETTINGS = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+KEY_PREFIX = 'token_auth'
+TOKEN_FIELDS = ('key', 'user_id', 'created')
+# Пароль в снимок не попадает, а счётчики часто меняются UPDATE в обход
+# сигналов. Эти поля у пользователя из снимка отложены и читаются из базы
+# при первом обращении.
+USER_FIELDS = tuple(
+    field.attname
+    for field in User._meta.concrete_fields
+    if field.name != 'password'
+    and field.name not in getattr(User, 'counter_fields', ())
+)
+
+
+def take_snapshot(token, user):
+    """Данные токена и пользователя, из которых их можно восстановить."""
+    return (
+        tuple(getattr(token, name) for name in TOKEN_FIELDS),
+        tuple(getattr(user, name) for name in USER_FIELDS),
+    )
+
+
+def restore_snapshot(snapshot):
+    token_values, user_values = snapshot
+    token = Token.from_db(DEFAULT_DB_ALIAS, TOKEN_FIELDS, token_values)
+    token.user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+    return token.user, token
+
+
+class TokenCache:
+    """Потокобезопасный LRU-кэш снимков пользователей по ключу токена.
+    Записи живут timeout секунд и вытесняются при превышении max_entries.
+    С shared_timeout снимки дополнительно хранятся в общем кэше Django,
+    чтобы другие процессы не ходили в базу за тем же токеном. Сигналы
+    удаляют записи при удалении токена и изменении пользователя, а другой
+    процесс увидит изменение не позже, чем истечёт его локальная запись.
+    Снимок, прочитанный до сброса, в кэш уже не попадает: это отслеживает
+    счётчик поколений.
+    """
+
+    def __init__(self, max_entries, timeout, shared_timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.shared_timeout = shared_timeout
+        self.generation = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def shared_key(key):
+        return f'{KEY_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            generation = self.generation
+        if self.shared_timeout is not None:
+            snapshot = cache.get(self.shared_key(key))
+            if snapshot is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self._store(key, snapshot, generation)
+                return snapshot
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, snapshot, generation):
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._entries[key] = (time.monotonic() + self.timeout, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def set(self, key, snapshot, generation):
+        """Сохраняет снимок, если после generation кэш не сбрасывали."""
+        if self._store(key, snapshot, generation) and (
+            self.shared_timeout is not None
+        ):
+            cache.set(self.shared_key(key), snapshot, self.shared_timeout)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared_timeout is not None:
+            cache.delete_many([self.shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает снимки всех токенов пользователя."""
+        with self._lock:
+            keys = [
+                key
+                for key, (_, (token_values, _)) in self._entries.items()
+                if token_values[1] == user_id
+            ]
+        if self.shared_timeout is not None:
+            keys.extend(
+                Token.objects.filter(user_id=user_id).values_list(
+                    'key', flat=True
+                )
+            )
+        self.invalidate(*keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    max_entries=CACHE_SETTINGS.get('MAX_ENTRIES', 1024),
+    timeout=CACHE_SETTINGS.get('TIMEOUT', 30),
+    shared_timeout=(
+        CACHE_SETTINGS.get('SHARED_TIMEOUT', 300)
+        if CACHE_SETTINGS.get('SHARED')
+        else None
+    ),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который не ходит в базу за известным токеном.
+    Пользователь восстанавливается из снимка в token_cache. Неизвестный
+    токен и неактивный пользователь проверяются обычным путём и в кэш
+    не попадают.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is not None:
+            return restore_snapshot(snapshot)
+        generation = token_cache.generation
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, take_snapshot(token, user), generation)
+        return user, token
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import threading
+import time
+from typing import NamedTuple
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from recipes.models import Ingredient, Tag
+from .renderers import FastJSONRenderer
+from .serializers import IngredientSerializer, TagSerializer
+from .versions import SharedVersion
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CONTENT_TYPE = 'application/json'
+
+
+class CatalogSnapshot(NamedTuple):
+    """Готовый ответ справочника во всех вариантах сжатия."""
+
+    encodings: dict
+    etag: str
+    last_modified: int
+
+    def get_etag(self, encoding):
+        if encoding == 'identity':
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+class Catalog:
+    """Справочник, отдаваемый одним и тем же заранее собранным ответом.
+    Ответ сериализуется один раз, сжимается gzip и brotli и хранится
+    в памяти процесса. Сигналы моделей меняют версию справочника в базе
+    в той же транзакции, что и данные, и остальные процессы узнают по ней
+    об изменении. Снимок старше MAX_AGE собирается заново в любом случае.
+    """
+
+    def __init__(self, name, get_queryset, serializer_class):
+        self.version = SharedVersion(f'catalog_{name}')
+        self.get_queryset = get_queryset
+        self.serializer_class = serializer_class
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._snapshot = None
+        self._version = None
+        self._built_at = None
+        self.version.expire()
+
+    def invalidate(self):
+        self.version.bump()
+
+    def get_snapshot(self):
+        with self._lock:
+            if self._snapshot is None or not self.version.is_current(
+                self._version, self._built_at
+            ):
+                # Версия читается до данных: изменение, попавшее между
+                # ними, только вызовет ещё одну сборку.
+                self._version = self.version.get()
+                self._built_at = time.monotonic()
+                self._snapshot = self.build()
+            return self._snapshot
+
+    def get_data(self):
+        # Снимок живёт до смены версии, поэтому читается из основной базы,
+        # а не из реплики, которая может отставать от только что записанного.
+        return self.serializer_class(
+            self.get_queryset().using(DEFAULT_DB_ALIAS), many=True
+        ).data
+
+    def build(self):
+        body = FastJSONRenderer().render(self.get_data())
+        encodings = {
+            'identity': body,
+            'gzip': gzip.compress(body, mtime=0),
+        }
+        if brotli is not None:
+            encodings['br'] = brotli.compress(body)
+        return CatalogSnapshot(
+            encodings=encodings,
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            last_modified=int(time.time()),
+        )
+
+
+def choose_encoding(request, encodings):
+    accepted = {
+        value.split(';')[0].strip()
+        for value in request.headers.get('Accept-Encoding', '').split(',')
+    }
+    for encoding in ('br', 'gzip'):
+        if encoding in accepted and encoding in encodings:
+            return encoding
+    return 'identity'
+
+
+def is_not_modified(request, snapshot, encoding):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        etags = {
+            etag[2:] if etag.startswith('W/') else etag
+            for etag in parse_etags(if_none_match)
+        }
+        return '*' in etags or snapshot.get_etag(encoding) in etags
+    if_modified_since = parse_http_date_safe(
+        request.headers.get('If-Modified-Since', '')
+    )
+    return (
+        if_modified_since is not None
+        and snapshot.last_modified <= if_modified_since
+    )
+
+
+def catalog_response(request, catalog):
+    """Отдаёт справочник из памяти: 304 или готовые байты нужного сжатия."""
+    snapshot = catalog.get_snapshot()
+    encoding = choose_encoding(request, snapshot.encodings)
+    if is_not_modified(request, snapshot, encoding):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            snapshot.encodings[encoding], content_type=CONTENT_TYPE
+        )
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = snapshot.get_etag(encoding)
+    response['Last-Modified'] = http_date(snapshot.last_modified)
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+ingredients_catalog = Catalog(
+    'ingredients', Ingredient.objects.all, IngredientSerializer
+)
+tags_catalog = Catalog('tags', Tag.objects.all, TagSerializer)
@@ -0,0 +1,215 @@
+import base64
+import binascii
+import re
+import uuid
+
+import filetype
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+UPLOAD_SETTINGS = getattr(settings, 'IMAGE_UPLOAD', {})
+BASE64_CHUNK_SIZE = 4 * 16 * 1024
+# Символы вне алфавита base64, которые b64decode молча пропускает,
+# например переносы строк из base64.encodebytes.
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+def iter_base64_chunks(base64_data, start):
+    """Куски base64 длиной кратной 4, которые декодируются независимо.
+    Посторонние символы убираются до нарезки, а неполная четвёрка
+    переносится в следующий кусок.
+    """
+    rest = ''
+    for position in range(start, len(base64_data), BASE64_CHUNK_SIZE):
+        chunk = rest + NOT_BASE64.sub(
+            '', base64_data[position:position + BASE64_CHUNK_SIZE]
+        )
+        end = len(chunk) - len(chunk) % 4
+        rest = chunk[end:]
+        if end:
+            yield chunk[:end]
+    if rest:
+        yield rest
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, который достаётся одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.resolve(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, разрешающий все id одним запросом in_bulk.
+    С many=True разрешает весь список сразу. Внутри вложенного списка
+    сериализаторов id можно заранее разрешить методом resolve, тогда каждый
+    элемент берёт объект из уже загруженных. О всех несуществующих id
+    сообщается одной ошибкой.
+    """
+
+    default_error_messages = {
+        'does_not_exist_bulk': 'Объекты с id {pk_values} не существуют.',
+    }
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.resolved = {}
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def to_internal_value(self, data):
+        pk = self.to_pk(data)
+        if pk in self.resolved:
+            return self.resolved[pk]
+        return super().to_internal_value(pk)
+
+    def resolve(self, values):
+        """Загружает объекты по списку id и возвращает их в том же порядке."""
+        pks = [self.to_pk(value) for value in values]
+        unresolved = set(pks) - self.resolved.keys()
+        if unresolved:
+            self.resolved.update(self.get_queryset().in_bulk(unresolved))
+        missing = sorted(set(pks) - self.resolved.keys())
+        if missing:
+            self.fail(
+                'does_not_exist_bulk',
+                pk_values=', '.join(map(str, missing)),
+            )
+        return [self.resolved[pk] for pk in pks]
+
+
+class ImageVariantField(serializers.ReadOnlyField):
+    """Ссылка на уменьшенную копию фото или None, пока её нет."""
+
+    def __init__(self, variant, **kwargs):
+        kwargs['source'] = 'image_variants'
+        super().__init__(**kwargs)
+        self.variant = variant
+
+    def to_representation(self, value):
+        name = value.get(self.variant)
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class TemporaryImageFile(TemporaryUploadedFile):
+    """Временный файл, который можно безопасно закрыть после переноса.
+    Хранилище переносит временный файл на место, поэтому удалять
+    при сборке мусора уже нечего.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField, декодирующий картинку кусками во временный файл.
+    Размер файла проверяется по длине base64 ещё до декодирования,
+    а размер картинки в пикселях - по заголовку, как только он записан.
+    В памяти одновременно держится только один кусок декодированных данных.
+    """
+
+    default_error_messages = {
+        'too_large': 'Файл больше {max_bytes} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_bytes = kwargs.pop(
+            'max_bytes', UPLOAD_SETTINGS.get('MAX_BYTES', 10 * 1024 * 1024)
+        )
+        self.max_pixels = kwargs.pop(
+            'max_pixels', UPLOAD_SETTINGS.get('MAX_PIXELS', 40_000_000)
+        )
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        content_type = None
+        start = 0
+        if ';base64,' in base64_data[:256]:
+            header, _ = base64_data[:256].split(';base64,', 1)
+            start = len(header) + len(';base64,')
+            if self.trust_provided_content_type:
+                content_type = header.replace('data:', '')
+        size = (len(base64_data) - start) * 3 // 4
+        if size > self.max_bytes:
+            self.fail('too_large', max_bytes=self.max_bytes)
+        upload = TemporaryImageFile('upload', content_type, size, None)
+        try:
+            extension = self.decode_to_file(base64_data, start, upload)
+        except Exception:
+            upload.close()
+            raise
+        upload.name = f'{uuid.uuid4()}.{extension}'
+        upload.size = upload.tell()
+        upload.seek(0)
+        return super(Base64FieldMixin, self).to_internal_value(upload)
+
+    def decode_to_file(self, base64_data, start, upload):
+        extension = None
+        pixels_checked = False
+        for encoded in iter_base64_chunks(base64_data, start):
+            try:
+                chunk = base64.b64decode(encoded)
+            except (TypeError, binascii.Error, ValueError):
+                raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+            if extension is None:
+                extension = filetype.guess_extension(chunk)
+                if extension == 'jpeg':
+                    extension = 'jpg'
+                if extension not in self.ALLOWED_TYPES:
+                    raise serializers.ValidationError(
+                        self.INVALID_TYPE_MESSAGE
+                    )
+            upload.write(chunk)
+            if not pixels_checked:
+                upload.flush()
+                pixels_checked = self.check_pixels(upload)
+        if extension is None:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        return extension
+
+    def check_pixels(self, upload):
+        """Проверяет размер картинки по уже записанному заголовку."""
+        try:
+            with Image.open(upload.temporary_file_path()) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels)
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            return False
+        if width * height > self.max_pixels:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels)
+        return True
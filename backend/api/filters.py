@@ -1,6 +1,12 @@
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
 from recipes.models import Ingredient, Recipe, Tag
+from .serializers import MAX_BATCH_SIZE
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class IngredientFilter(FilterSet):
@@ -30,6 +36,9 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    ids = NumberInFilter(
+        method='get_ids',
+    )
 
     class Meta:
         model = Recipe
@@ -39,8 +48,28 @@ class RecipeFilter(FilterSet):
             'tags',
             'is_favorited',
             'is_in_shopping_cart',
+            'ids',
         )
 
+    def filter_queryset(self, queryset):
+        # Пустой ?ids= фильтр пропустил бы, а без страниц ответ вернул бы
+        # всю таблицу рецептов.
+        if 'ids' in self.data and not any(
+            pk is not None for pk in self.form.cleaned_data.get('ids') or ()
+        ):
+            raise ValidationError(
+                {'ids': 'Укажите id рецептов через запятую.'}
+            )
+        return super().filter_queryset(queryset)
+
+    def get_ids(self, queryset, name, value):
+        value = [pk for pk in value if pk is not None]
+        if len(value) > MAX_BATCH_SIZE:
+            raise ValidationError(
+                {'ids': f'Не больше {MAX_BATCH_SIZE} рецептов за запрос.'}
+            )
+        return queryset.filter(id__in=value)
+
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
@@ -0,0 +1,166 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from recipes.models import Ingredient
+from .versions import SharedVersion
+
+NGRAM = 3
+
+
+def fold(value):
+    """Приводит строку к виду для поиска без учёта регистра."""
+    return value.casefold()
+
+
+def ngrams(value):
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+    Отсортированный массив названий отвечает на поиск по префиксу,
+    индекс триграмм - на поиск по подстроке. Сначала выдаются совпадения
+    по префиксу, затем по подстроке, каждая группа по алфавиту.
+    Индекс обновляется по сигналам моделей, а другие процессы узнают
+    об изменениях по версии в базе и перестраивают индекс. Индекс старше
+    MAX_AGE перестраивается в любом случае.
+    """
+
+    def __init__(self):
+        self.version = SharedVersion('ingredient_index')
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._ingredients = {}
+            self._folded = {}
+            self._keys = []
+            self._ngrams = defaultdict(set)
+            self._version = None
+            self._built_at = None
+            self.version.expire()
+
+    def build(self):
+        with self._lock:
+            # Версия читается до строк: изменение, закоммиченное во время
+            # чтения, сменит её, и следующий поиск перестроит индекс.
+            version = self.version.get()
+            self._ingredients = {}
+            self._folded = {}
+            self._keys = []
+            self._ngrams = defaultdict(set)
+            for ingredient in Ingredient.objects.using(
+                DEFAULT_DB_ALIAS
+            ).order_by():
+                self._add(ingredient)
+            self._keys.sort()
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        self.version.bump()
+
+    def ensure_fresh(self):
+        if self._version is None or not self.version.is_current(
+            self._version, self._built_at
+        ):
+            self.build()
+
+    def _add(self, ingredient):
+        key = fold(ingredient.name)
+        self._ingredients[ingredient.id] = ingredient
+        self._folded[ingredient.id] = key
+        self._keys.append((key, ingredient.id))
+        for ngram in ngrams(key):
+            self._ngrams[ngram].add(ingredient.id)
+
+    def _remove(self, ingredient_id):
+        self._ingredients.pop(ingredient_id, None)
+        key = self._folded.pop(ingredient_id, None)
+        if key is None:
+            return
+        position = bisect_left(self._keys, (key, ingredient_id))
+        if self._keys[position:position + 1] == [(key, ingredient_id)]:
+            del self._keys[position]
+        for ngram in ngrams(key):
+            self._ngrams[ngram].discard(ingredient_id)
+
+    def update(self, ingredient):
+        """Добавляет или обновляет ингредиент без полной перестройки.
+        Вызывается в транзакции, изменившей строку, а индекс правится
+        после коммита, чтобы перестройка индекса в другом потоке
+        не прочитала старые строки под новой версией.
+        """
+        self._apply_on_commit(partial(self._replace, ingredient))
+
+    def remove(self, ingredient_id):
+        self._apply_on_commit(partial(self._remove, ingredient_id))
+
+    def _replace(self, ingredient):
+        self._remove(ingredient.id)
+        self._add(ingredient)
+        self._keys.sort()
+
+    def _apply_on_commit(self, change):
+        previous, version = self.version.bump()
+        transaction.on_commit(
+            partial(self._apply, change, previous, version),
+            using=DEFAULT_DB_ALIAS,
+        )
+
+    def _apply(self, change, previous, version):
+        """Правит индекс на месте, только если он собран ровно из версии
+        до этого изменения: иначе его опередили другие процессы, и индекс
+        перестроится при следующем поиске.
+        """
+        with self._lock:
+            if self._version != previous:
+                self._version = None
+                return
+            change()
+            self._version = version
+
+    def search(self, query, limit=None):
+        """Возвращает ингредиенты: сначала по префиксу, затем по подстроке."""
+        query = fold(query)
+        with self._lock:
+            self.ensure_fresh()
+            start = bisect_left(self._keys, (query,))
+            prefix_ids = []
+            for key, ingredient_id in self._keys[start:]:
+                if not key.startswith(query):
+                    break
+                prefix_ids.append(ingredient_id)
+                if limit is not None and len(prefix_ids) >= limit:
+                    return self._resolve(prefix_ids)
+            found = set(prefix_ids)
+            if len(query) >= NGRAM:
+                candidates = set.intersection(
+                    *(self._ngrams.get(ngram, set())
+                      for ngram in ngrams(query))
+                )
+                substring_keys = sorted(
+                    (self._folded[pk], pk)
+                    for pk in candidates - found
+                )
+            else:
+                substring_keys = self._keys
+            substring_ids = [
+                ingredient_id
+                for key, ingredient_id in substring_keys
+                if query in key and ingredient_id not in found
+            ]
+            result = prefix_ids + substring_ids
+            return self._resolve(result if limit is None else result[:limit])
+
+    def _resolve(self, ingredient_ids):
+        return [self._ingredients[pk] for pk in ingredient_ids]
+
+
+ingredient_index = IngredientIndex()
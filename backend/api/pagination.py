@@ -1,4 +1,56 @@
+import base64
+import hashlib
+import json
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from foodgram.db_router import is_pinned_to_primary, may_lag_behind
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_SETTINGS = getattr(settings, 'PAGINATION_COUNT', {})
+COUNT_KEY_PREFIX = 'pagination-count'
+RECIPES_SCOPE = 'recipes'
+SUBSCRIPTIONS_SCOPE = 'subscriptions'
+
+
+def scope_key(scope, user_id=None):
+    if user_id is None:
+        return f'{COUNT_KEY_PREFIX}-version:{scope}'
+    return f'{COUNT_KEY_PREFIX}-version:{scope}:{user_id}'
+
+
+def invalidate_counts(scope, user_id=None):
+    """После коммита сбрасывает закешированные count области scope.
+    С user_id сбрасываются только личные count этого пользователя.
+    """
+    transaction.on_commit(
+        lambda: cache.set(scope_key(scope, user_id), time.time_ns(), None)
+    )
+
+
+def estimate_count(queryset):
+    """Оценка числа строк таблицы по статистике PostgreSQL или None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            (queryset.model._meta.db_table,),
+        )
+        row = cursor.fetchone()
+    return None if row is None else int(row[0])
 
 
 class LimitOnPagePagination(pagination.PageNumberPagination):
@@ -8,3 +60,220 @@ class LimitOnPagePagination(pagination.PageNumberPagination):
 
     page_size_query_param = 'limit'
     max_page_size = 50
+
+
+class CountedPaginator(Paginator):
+    """Paginator, который получает count через переданную функцию."""
+
+    def __init__(self, object_list, per_page, get_count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = get_count
+
+    @cached_property
+    def count(self):
+        return self.get_count(self.object_list)
+
+
+class CachedCountPagination(LimitOnPagePagination):
+    """Пагинатор с кешированием count.
+    Count хранится в кеше по нормализованным параметрам фильтрации
+    с коротким TTL и сбрасывается при записи через invalidate_counts.
+    Для запросов без фильтров по большой таблице PostgreSQL count
+    берётся из статистики планировщика, если она больше
+    ESTIMATE_THRESHOLD.
+    """
+
+    count_scope = RECIPES_SCOPE
+    personal = False
+    personal_query_params = ('is_favorited', 'is_in_shopping_cart')
+    ignored_query_params = (
+        'page', 'limit', 'recipes_limit', 'format', 'fields', 'omit',
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CountedPaginator, get_count=partial(self.get_count, request)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def is_personal(self, request):
+        return request.user.is_authenticated and (
+            self.personal
+            or any(
+                param in request.query_params
+                for param in self.personal_query_params
+            )
+        )
+
+    def get_count_key(self, request):
+        """Ключ count и версии областей, от которых он зависит.
+        Возвращает ключ и сами версии.
+        """
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if name not in self.ignored_query_params
+        )
+        version_keys = [scope_key(self.count_scope)]
+        if self.is_personal(request):
+            params.append(('user', request.user.pk))
+            version_keys.append(scope_key(self.count_scope, request.user.pk))
+        versions = cache.get_many(version_keys)
+        key = hashlib.md5(
+            json.dumps(
+                [params, [versions.get(key, 0) for key in version_keys]]
+            ).encode()
+        ).hexdigest()
+        return f'{COUNT_KEY_PREFIX}:{self.count_scope}:{key}', versions
+
+    def get_count(self, request, queryset):
+        threshold = COUNT_SETTINGS.get('ESTIMATE_THRESHOLD', 0)
+        if threshold and not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        key, versions = self.get_count_key(request)
+        # После своей записи пользователь пересчитывает count по основной
+        # базе, а не берёт значение, посчитанное по отстающей реплике.
+        if is_pinned_to_primary(request.user):
+            count = None
+        else:
+            count = cache.get(key)
+        if count is None:
+            read_at = time.time_ns()
+            count = queryset.count()
+            # Count из реплики, которая может отставать от последнего
+            # сброса, отдаётся, но не кешируется под новой версией.
+            if not any(
+                may_lag_behind(version, read_at)
+                for version in versions.values()
+            ):
+                cache.set(key, count, COUNT_SETTINGS.get('TIMEOUT', 60))
+        return count
+
+
+class KeysetPagination(pagination.BasePagination):
+    """Пагинатор по ключу (keyset) без COUNT(*) и OFFSET.
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    следующая страница выбирается условием «после этих значений».
+    Последнее поле сортировки должно быть уникальным.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.page_size = api_settings.PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(
+                    field.lstrip('-')
+                ).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek(self, values):
+        """Условие «строго после values» в порядке сортировки."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.seek(self.decode_cursor(queryset, cursor))
+            )
+        page = list(queryset[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        self.page = page[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [
+            getattr(last, field.lstrip('-')) for field in self.ordering
+        ]
+        cursor = self.encode_cursor(
+            [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values
+            ]
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            cursor,
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                'next': self.get_next_link(),
+                'previous': None,
+                'results': data,
+            }
+        )
+
+
+class LimitOnPageOrKeysetPagination(CachedCountPagination):
+    """Постраничная пагинация page/limit или keyset по параметру cursor.
+    Без параметра cursor работает как CachedCountPagination. С ним,
+    даже пустым, страницы выбираются по ключу сортировки ordering
+    и ответ не содержит count.
+    """
+
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param not in request.query_params:
+            self.keyset = None
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(self.ordering)
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return self.keyset.get_paginated_response(data)
+
+
+class SubscriptionsPagination(LimitOnPageOrKeysetPagination):
+    ordering = ('username', 'id')
+    count_scope = SUBSCRIPTIONS_SCOPE
+    personal = True
@@ -0,0 +1,55 @@
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Целые вне 64 бит orjson читает как float, а стандартный json как int.
+MAX_EXACT_FLOAT = 2 ** 63
+
+
+def has_long_integer(value):
+    """Есть ли в разобранных данных float, который мог быть длинным целым.
+    Обходит только списки и словари, поэтому длинные строки вроде
+    картинок в base64 не просматриваются.
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if abs(value) >= MAX_EXACT_FLOAT:
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return False
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson с откатом на стандартный json.
+    Всё, на чём orjson ошибается или расходится со стандартным json
+    (бесконечности, одиночные суррогаты, BOM, длинные целые, кодировка
+    не UTF-8), разбирается стандартным путём, поэтому результат и ошибки
+    разбора совпадают с JSONParser.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if not has_long_integer(data):
+                return data
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,126 @@
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+
+
+class RelationTable:
+    """Имена таблицы и колонок модели связи для запросов на чистом SQL."""
+
+    def __init__(self, model, names):
+        self.model = model
+        self.connection = connections[router.db_for_write(model)]
+        quote = self.connection.ops.quote_name
+        opts = model._meta
+        self.fields = [opts.get_field(name) for name in names]
+        self.table = quote(opts.db_table)
+        self.pk = quote(opts.pk.column)
+        self.columns = [quote(field.column) for field in self.fields]
+        self.returning = ', '.join((self.pk, *self.columns))
+
+    def prep(self, field, value):
+        return field.get_db_prep_value(value, self.connection)
+
+    def instances(self, rows):
+        """Объекты модели по строкам, которые вернул RETURNING."""
+        instances = []
+        for pk, *values in rows:
+            instance = self.model(
+                pk=pk,
+                **{
+                    field.attname: value
+                    for field, value in zip(self.fields, values)
+                },
+            )
+            instance._state.adding = False
+            instance._state.db = self.connection.alias
+            instances.append(instance)
+        return instances
+
+
+def add_relations(model, rows):
+    """Создаёт связи одним INSERT ... ON CONFLICT DO NOTHING.
+    Возвращает только действительно вставленные объекты: строки, которые
+    уже были в базе или которые параллельно вставил другой запрос,
+    пропускаются без ошибки уникальности. Сигнал post_save отправляется
+    вручную, чтобы счётчики и кэши обновились как при обычном create().
+    """
+    if not rows:
+        return []
+    relation = RelationTable(model, rows[0])
+    values = ', '.join(
+        [f'({", ".join(["%s"] * len(relation.columns))})'] * len(rows)
+    )
+    params = [
+        relation.prep(field, row[field.attname])
+        for row in rows
+        for field in relation.fields
+    ]
+    connection = relation.connection
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {relation.table} '
+                f'({", ".join(relation.columns)}) VALUES {values} '
+                f'ON CONFLICT DO NOTHING RETURNING {relation.returning}',
+                params,
+            )
+            created = relation.instances(cursor.fetchall())
+        for instance in created:
+            post_save.send(
+                sender=model,
+                instance=instance,
+                created=True,
+                update_fields=None,
+                raw=False,
+                using=connection.alias,
+            )
+    return created
+
+
+def add_relation(model, **values):
+    """Создаёт одну связь или возвращает None, если она уже есть."""
+    created = add_relations(model, [values])
+    return created[0] if created else None
+
+
+def remove_relations(model, **values):
+    """Удаляет связи одним DELETE ... RETURNING и возвращает удалённые.
+    Значение-список превращается в условие IN. Для каждой удалённой
+    строки отправляет post_delete, как delete().
+    """
+    relation = RelationTable(model, values)
+    conditions = []
+    params = []
+    for field, column in zip(relation.fields, relation.columns):
+        value = values[field.attname]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            if not value:
+                return []
+            conditions.append(
+                f'{column} IN ({", ".join(["%s"] * len(value))})'
+            )
+            params.extend(relation.prep(field, item) for item in value)
+        else:
+            conditions.append(f'{column} = %s')
+            params.append(relation.prep(field, value))
+    connection = relation.connection
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {relation.table} '
+                f'WHERE {" AND ".join(conditions)} '
+                f'RETURNING {relation.returning}',
+                params,
+            )
+            deleted = relation.instances(cursor.fetchall())
+        for instance in deleted:
+            post_delete.send(
+                sender=model,
+                instance=instance,
+                using=connection.alias,
+            )
+    return deleted
+
+
+def remove_relation(model, **values):
+    """Удаляет связь и возвращает число удалённых строк."""
+    return len(remove_relations(model, **values))
@@ -0,0 +1,76 @@
+import math
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Числа в экспоненциальной записи и вида 0.0000..., которые orjson пишет
+# не так, как float.__repr__ в стандартном json. Экспонента ищется в копии
+# ответа, где все цифры заменены нулём, чтобы у шаблона был постоянный
+# префикс. Совпадение внутри строки только отправляет ответ стандартным
+# путём.
+DIGITS = bytes.maketrans(b'123456789', b'000000000')
+NUMBER_END = rb'(?=[,\]}]|$)'
+EXPONENT_FLOAT = re.compile(rb'0e-?0+' + NUMBER_END)
+SMALL_FLOAT = re.compile(rb'0\.0000(?<![^:,\[-]0\.0000)\d*' + NUMBER_END)
+
+
+def has_inexact_float(ret):
+    return bool(
+        SMALL_FLOAT.search(ret)
+        or EXPONENT_FLOAT.search(ret.translate(DIGITS))
+    )
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с откатом на стандартный json.
+    Ответ совпадает с JSONRenderer байт в байт: Decimal, datetime,
+    ленивые строки и прочее, что orjson не знает, приводятся тем же
+    кодировщиком DRF, а ответы с отступами, ошибками orjson, неточными
+    для orjson числами или без установленного orjson рендерятся
+    стандартным путём. Расходится только нечисловое float вне Decimal:
+    orjson пишет его как null, а стандартный json завершается ошибкой.
+    """
+
+    options = (
+        orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None
+        else 0
+    )
+
+    def default(self, obj):
+        value = self.encoder_class().default(obj)
+        if isinstance(value, float) and not math.isfinite(value):
+            raise TypeError('Нечисловое значение float')
+        return value
+
+    def is_fast(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None
+            and self.compact
+            and not self.ensure_ascii
+            and not self.get_indent(accepted_media_type, renderer_context)
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.is_fast(
+            accepted_media_type, renderer_context or {}
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            ret = None
+        if ret is None or has_inexact_float(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from foodgram.db_router import may_lag_behind
+from rest_framework.response import Response
+
+CACHE_SETTINGS = getattr(settings, 'RECIPE_RESPONSE_CACHE', {})
+KEY_PREFIX = 'recipes-response'
+TAG_PREFIX = 'recipes-response-tag'
+ALL_RECIPES = 'recipes'
+RECIPE_LIST = 'recipes:list'
+NAME_FILTERED = 'recipes:list:name'
+
+
+def recipe_tag(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def slug_tag(slug):
+    return f'tag:{slug}'
+
+
+def author_tag(author_id):
+    return f'user:{author_id}'
+
+
+def tag_key(tag):
+    return f'{TAG_PREFIX}:{tag}'
+
+
+def invalidate(*tags):
+    """После коммита сбрасывает все ответы, помеченные любым из тегов."""
+    transaction.on_commit(
+        lambda: cache.set_many(
+            {tag_key(tag): time.time_ns() for tag in tags}, timeout=None
+        )
+    )
+
+
+def collect_tags(recipes):
+    """Собирает теги ответа по рецептам, тегам и авторам в нём."""
+    tags = {ALL_RECIPES}
+    for recipe in recipes:
+        tags.add(recipe_tag(recipe['id']))
+        tags.update(slug_tag(tag['slug']) for tag in recipe.get('tags', ()))
+        if 'author' in recipe:
+            tags.add(author_tag(recipe['author']['id']))
+    return tags
+
+
+def list_tags(request, data):
+    results = data['results'] if isinstance(data, dict) else data
+    tags = collect_tags(results) | {RECIPE_LIST} | {
+        slug_tag(slug) for slug in request.query_params.getlist('tags')
+    }
+    if 'name' in request.query_params:
+        tags.add(NAME_FILTERED)
+    return tags
+
+
+class RecipeResponseCache:
+    """Кэш ответов списка и страницы рецепта для анонимных пользователей.
+    Запись помечается тегами рецептов, тегов и авторов, попавших в ответ,
+    и хранит версии этих тегов на момент сохранения. Сигналы моделей
+    меняют версии тегов, и запись с устаревшей версией считается промахом.
+    Одновременные промахи по одному ключу в процессе считаются один раз.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._guard = threading.Lock()
+        self._flights = {}
+
+    @staticmethod
+    def is_cacheable(request):
+        return (
+            request.method == 'GET'
+            and request.user.is_anonymous
+            and request.accepted_renderer.format == 'json'
+        )
+
+    @staticmethod
+    def make_key(request, action, pk=None):
+        query = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        digest = hashlib.md5(
+            repr((request.get_host(), action, pk, query)).encode()
+        ).hexdigest()
+        return f'{KEY_PREFIX}:{digest}'
+
+    @staticmethod
+    def get_tag_versions(tags):
+        keys = {tag_key(tag): tag for tag in tags}
+        versions = cache.get_many(keys)
+        for key in keys.keys() - versions.keys():
+            cache.add(key, 0, timeout=None)
+            versions[key] = cache.get(key, 0)
+        return {keys[key]: version for key, version in versions.items()}
+
+    def get(self, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        data, versions = entry
+        current = cache.get_many([tag_key(tag) for tag in versions])
+        if any(
+            current.get(tag_key(tag)) != version
+            for tag, version in versions.items()
+        ):
+            return None
+        return data
+
+    def set(self, key, data, tags, started):
+        """Сохраняет ответ, если его теги не менялись после started.
+        Ответ, прочитанный из реплики, не сохраняется, пока реплика может
+        ещё не видеть последнее изменение его тегов.
+        """
+        versions = self.get_tag_versions(tags)
+        if all(
+            version <= started and not may_lag_behind(version, started)
+            for version in versions.values()
+        ):
+            cache.set(key, (data, versions), self.timeout)
+
+    @contextmanager
+    def single_flight(self, key):
+        with self._guard:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self._guard:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._flights[key]
+
+    def respond(self, request, compute, tags, action, pk=None):
+        """Отдаёт ответ из кэша или вычисляет его функцией compute."""
+        if not self.is_cacheable(request):
+            return compute()
+        key = self.make_key(request, action, pk)
+        data = self.get(key)
+        if data is not None:
+            return Response(data)
+        with self.single_flight(key):
+            data = self.get(key)
+            if data is not None:
+                return Response(data)
+            started = time.time_ns()
+            response = compute()
+            if response.status_code == 200:
+                self.set(key, response.data, tags(response.data), started)
+            return response
+
+
+recipe_response_cache = RecipeResponseCache(
+    timeout=CACHE_SETTINGS.get('TIMEOUT', 300)
+)
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import F
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
@@ -6,13 +8,146 @@ from rest_framework import serializers
 
 from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
 from users.models import Follow
+from .fields import (BulkPrimaryKeyRelatedField, ImageVariantField,
+                     StreamingBase64ImageField)
 
 User = get_user_model()
 MIN_TIME_COOKING_LIMIT = 1
 MAX_TIME_COOKING_LIMIT = 300
+MAX_BATCH_SIZE = getattr(settings, 'RECIPE_BATCH', {}).get('MAX_SIZE', 50)
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def get_positive_int(value):
+    """Возвращает значение как положительное целое или None."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def get_recipes_limit(request):
+    """Возвращает положительный recipes_limit из запроса или None."""
+    return get_positive_int(request.query_params.get('recipes_limit'))
+
+
+def get_query_names(request, param):
+    """Имена через запятую из параметра запроса, в том числе повторённого."""
+    if request is None:
+        return set()
+    return {
+        name.strip()
+        for value in request.query_params.getlist(param)
+        for name in value.split(',')
+        if name.strip()
+    }
+
+
+def get_selected_fields(request, names):
+    """Оставляет из names поля, выбранные параметрами ?fields= и ?omit=.
+    Неизвестные имена игнорируются, а id остаётся всегда, чтобы объект
+    в ответе можно было опознать.
+    """
+    fields = get_query_names(request, FIELDS_PARAM)
+    omit = get_query_names(request, OMIT_PARAM) - {'id'}
+    return {
+        name
+        for name in names
+        if (not fields or name in fields or name == 'id') and name not in omit
+    }
+
+
+class SparseFieldsMixin:
+    """Отдаёт только поля, выбранные параметрами ?fields= и ?omit=.
+    Выбор действует на сериализатор верхнего уровня ответа, вложенные
+    сериализаторы отдают все свои поля. field_columns сопоставляет поле
+    колонкам модели, чтобы представление могло загрузить только их;
+    поле без записи читает одноимённую колонку.
+    """
+
+    field_columns = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        selected = get_selected_fields(self.context.get('request'), fields)
+        return {
+            name: field
+            for name, field in fields.items()
+            if name in selected
+        }
+
+    @classmethod
+    def get_columns(cls, selected):
+        """Колонки модели, нужные выбранным полям."""
+        columns = set()
+        for name in selected:
+            columns.update(cls.field_columns.get(name, (name,)))
+        return columns
+
+
+class SubscriptionResolver:
+    """Отвечает на вопрос «подписан ли пользователь на автора».
+    Загружает id авторов, на которых подписан пользователь запроса, одним
+    запросом и хранит их на объекте запроса, поэтому все сериализаторы
+    одного запроса проверяют подписку поиском по множеству.
+    """
+
+    request_attribute = '_subscribed_author_ids'
+
+    def __init__(self, user):
+        self.user = user
+        self._author_ids = None
+
+    @classmethod
+    def for_request(cls, request):
+        if request is None:
+            return cls(None)
+        resolver = getattr(request, cls.request_attribute, None)
+        if resolver is None or resolver.user != request.user:
+            resolver = cls(request.user)
+            setattr(request, cls.request_attribute, resolver)
+        return resolver
+
+    @property
+    def author_ids(self):
+        if self._author_ids is None:
+            if self.user is None or self.user.is_anonymous:
+                self._author_ids = frozenset()
+            else:
+                self._author_ids = frozenset(
+                    Follow.objects.filter(user=self.user).values_list(
+                        'author_id', flat=True
+                    )
+                )
+        return self._author_ids
+
+    def is_subscribed(self, author):
+        return author.id in self.author_ids
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления или удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
 
 class RecipesForFavoriteCartFollowedSerializer(serializers.ModelSerializer):
+    thumbnail = ImageVariantField('thumbnail')
+    thumbnail_webp = ImageVariantField('thumbnail_webp')
 
     class Meta:
         model = Recipe
@@ -20,16 +155,19 @@ class RecipesForFavoriteCartFollowedSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'thumbnail',
+            'thumbnail_webp',
             'cooking_time',
         )
 
 
-class FoodgramUserSerializer(UserSerializer):
+class FoodgramUserSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор для кастомной модели пользователя.
     Получает список пользователей подмешивая новое поле is_subscribe.
     """
 
     is_subscribed = serializers.SerializerMethodField()
+    field_columns = {'is_subscribed': ()}
 
     class Meta:
         model = User
@@ -44,13 +182,11 @@ class FoodgramUserSerializer(UserSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        return (
-            False
-            if user.is_anonymous
-            else Follow.objects.filter(author=obj, user=user).exists()
-        )
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return SubscriptionResolver.for_request(
+            self.context.get('request')
+        ).is_subscribed(obj)
 
 
 class FoodgramCreateUserSerializer(UserCreateSerializer):
@@ -99,7 +235,8 @@ class UserFollowerSerializer(serializers.ModelSerializer):
 
 class UserFollowSerializer(UserFollowerSerializer, FoodgramUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
+    field_columns = {'is_subscribed': (), 'recipes': ()}
 
     class Meta:
         model = User
@@ -120,15 +257,12 @@ class UserFollowSerializer(UserFollowerSerializer, FoodgramUserSerializer):
             'last_name',
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = int(request.query_params.get('recipes_limit'))
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:recipes_limit]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()[:recipes_limit]
         serializer = RecipesForFavoriteCartFollowedSerializer(
             recipes,
             many=True,
@@ -158,7 +292,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class RecipeGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(
         read_only=True,
         many=True,
@@ -168,6 +302,28 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    thumbnail = ImageVariantField('thumbnail')
+    thumbnail_webp = ImageVariantField('thumbnail_webp')
+    image_webp = ImageVariantField('image_webp')
+    image_avif = ImageVariantField('image_avif')
+    field_columns = {
+        'tags': (),
+        'author': (
+            'author',
+            'author__email',
+            'author__id',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+        ),
+        'ingredients': (),
+        'is_favorited': (),
+        'is_in_shopping_cart': (),
+        'thumbnail': ('image_variants',),
+        'thumbnail_webp': ('image_variants',),
+        'image_webp': ('image_variants',),
+        'image_avif': ('image_variants',),
+    }
 
     class Meta:
         model = Recipe
@@ -180,11 +336,25 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnail',
+            'thumbnail_webp',
+            'image_webp',
+            'image_avif',
             'text',
             'cooking_time',
         )
 
     def get_ingredients(self, obj):
+        if hasattr(obj, 'amounts'):
+            return [
+                {
+                    'id': amount.ingredient.id,
+                    'name': amount.ingredient.name,
+                    'measurement_unit': amount.ingredient.measurement_unit,
+                    'amount': amount.amount,
+                }
+                for amount in obj.amounts
+            ]
         ingredients = obj.ingredients.values(
             'id',
             'name',
@@ -194,6 +364,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         return ingredients
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         user = request.user
         return (
@@ -203,6 +375,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         user = request.user
         return (
@@ -212,14 +386,28 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
 
+class AmountIngredientListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, id которых разрешаются одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields['id'].resolve(
+                item['id']
+                for item in data
+                if isinstance(item, dict) and 'id' in item
+            )
+        return super().to_internal_value(data)
+
+
 class AmountIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         required=True,
     )
 
     class Meta:
         model = AmountIngredient
+        list_serializer_class = AmountIngredientListSerializer
         fields = (
             'id',
             'amount',
@@ -237,11 +425,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = AmountIngredientSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
     )
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -260,17 +448,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'ingredients': 'Рецепт без ингредиентов - несуществует!'}
             )
-        ingredients_for_recipe = []
-        for ingredient in value:
-            ingredient_id = ingredient.get('id')
-            if ingredient_id in ingredients_for_recipe:
-                raise serializers.ValidationError(
-                    {
-                        'recipe': 'Один и тот же ингредиент, '
-                        'добейтесь уникальности!'
-                    }
-                )
-            ingredients_for_recipe.append(ingredient_id)
+        ingredients_for_recipe = {ingredient.get('id') for ingredient in value}
+        if len(ingredients_for_recipe) != len(value):
+            raise serializers.ValidationError(
+                {
+                    'recipe': 'Один и тот же ингредиент, '
+                    'добейтесь уникальности!'
+                }
+            )
         return value
 
     def validate_tags(self, value):
@@ -278,13 +463,10 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'tags': 'Теги обязательны, выберите один!'}
             )
-        tags_for_recipe = []
-        for tag in value:
-            if tag in tags_for_recipe:
-                raise serializers.ValidationError(
-                    {'recipe': 'Такой тег уже есть!'}
-                )
-            tags_for_recipe.append(tag)
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                {'recipe': 'Такой тег уже есть!'}
+            )
         return value
 
     def validate_cooking_time(self, value):
@@ -299,33 +481,59 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Фото или картинка обязательны!')
         return value
 
-    def create_tags_and_ingredients(self, ingredients, tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
-        list_ingredients = [
+    def save_ingredients(self, recipe, ingredients, stored=None):
+        """Приводит ингредиенты рецепта к переданным одним диффом.
+        Вставляет новые, обновляет изменившиеся количества и удаляет
+        лишние строки AmountIngredient пакетными запросами.
+        """
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        stored = stored or {}
+        AmountIngredient.objects.filter(
+            recipe=recipe,
+            ingredient_id__in=stored.keys() - amounts.keys(),
+        ).delete()
+        changed = []
+        for ingredient_id, amount_ingredient in stored.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != amount_ingredient.amount:
+                amount_ingredient.amount = amount
+                changed.append(amount_ingredient)
+        AmountIngredient.objects.bulk_update(changed, ('amount',))
+        AmountIngredient.objects.bulk_create(
             AmountIngredient(
                 recipe=recipe,
-                ingredient=ingredient.get('id'),
-                amount=ingredient.get('amount'),
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
-            for ingredient in ingredients
-        ]
-        AmountIngredient.objects.bulk_create(list_ingredients)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in stored
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_tags_and_ingredients(ingredients, tags, recipe)
+        recipe.tags.add(*tags)
+        self.save_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
         instance = super().update(instance, validated_data)
-        AmountIngredient.objects.filter(recipe=instance).delete()
-        self.create_tags_and_ingredients(ingredients, tags, instance)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            stored = {
+                amount_ingredient.ingredient_id: amount_ingredient
+                for amount_ingredient in instance.amount_recipe.all()
+            }
+            self.save_ingredients(instance, ingredients, stored)
         return instance
 
     def to_representation(self, instance):
@@ -0,0 +1,219 @@
+import csv
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import NamedTuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Sum
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import AmountIngredient
+
+FONTS_DIR = settings.BASE_DIR / 'fonts'
+FONT = 'DejaVuSerif'
+FONT_BOLD = 'DejaVuSerif-Bold'
+TITLE = 'Список продуктов, который Вам потребуется:'
+X_PCM_PDF = 100
+Y_PCM_PDF = 800
+CHUNK_SIZE = 64 * 1024
+CACHE_SETTINGS = getattr(settings, 'SHOPPING_LIST_CACHE', {})
+
+
+class ShoppingListItem(NamedTuple):
+    """Строка списка покупок: ингредиент и суммарное количество."""
+
+    name: str
+    measurement_unit: str
+    amount: int
+
+
+class ShoppingListFormat(NamedTuple):
+    """Формат выгрузки списка покупок."""
+
+    content_type: str
+    render: object
+
+
+def aggregate_shopping_list(user):
+    """Собирает список покупок пользователя одним сгруппированным запросом.
+    Суммирует количества только по рецептам из корзины пользователя,
+    группируя по ингредиенту и единице измерения.
+    """
+    rows = (
+        AmountIngredient.objects.filter(recipe__carts_in__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total=Sum('amount'))
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+        .values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'total'
+        )
+    )
+    return tuple(ShoppingListItem(*row) for row in rows)
+
+
+@lru_cache(maxsize=None)
+def register_fonts():
+    """Регистрирует шрифты для PDF один раз за время жизни процесса."""
+    for font in (FONT, FONT_BOLD):
+        pdfmetrics.registerFont(TTFont(font, str(FONTS_DIR / f'{font}.ttf')))
+
+
+def format_item(number, item):
+    return f'{number}. {item.name}: {item.amount} {item.measurement_unit};'
+
+
+def render_pdf(items):
+    """PDF целиком собирается в памяти и только потом отдаётся кусками.
+    reportlab пишет таблицу ссылок и подмножество шрифта лишь в save(),
+    поэтому первый байт уходит после рендера всего файла. Потоково,
+    строка за строкой, отдаются только txt, csv и json.
+    """
+    register_fonts()
+    buffer = BytesIO()
+    page = canvas.Canvas(buffer)
+    page.setFont(FONT_BOLD, 13)
+    page.drawString(X_PCM_PDF, Y_PCM_PDF, TITLE)
+    y_for_string = 750
+    for number, item in enumerate(items, start=1):
+        page.setFont(FONT, 10)
+        page.drawString(X_PCM_PDF, y_for_string, format_item(number, item))
+        y_for_string -= 20
+        if y_for_string <= 50:
+            page.showPage()
+            y_for_string = 800
+    page.save()
+    buffer.seek(0)
+    while True:
+        chunk = buffer.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def render_txt(items):
+    yield f'{TITLE}\n'
+    for number, item in enumerate(items, start=1):
+        yield f'{format_item(number, item)}\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(ShoppingListItem._fields)
+    for item in items:
+        yield writer.writerow(item)
+
+
+def render_json(items):
+    yield '['
+    for number, item in enumerate(items):
+        if number:
+            yield ','
+        yield json.dumps(item._asdict(), ensure_ascii=False)
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'pdf': ShoppingListFormat('application/pdf', render_pdf),
+    'txt': ShoppingListFormat('text/plain; charset=utf-8', render_txt),
+    'csv': ShoppingListFormat('text/csv; charset=utf-8', render_csv),
+    'json': ShoppingListFormat('application/json', render_json),
+}
+
+
+def content_disposition(filename):
+    """Заголовок Content-Disposition для скачивания файла."""
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+class ArtifactCache:
+    """Потокобезопасный LRU-кэш готовых файлов списка покупок.
+    Вытесняет давно не запрошенные файлы при превышении лимита
+    на число записей или на их суммарный размер в байтах.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def set(self, key, content):
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = content
+            self.size += len(content)
+            while (
+                len(self._entries) > self.max_entries
+                or self.size > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+artifact_cache = ArtifactCache(
+    max_entries=CACHE_SETTINGS.get('MAX_ENTRIES', 512),
+    max_bytes=CACHE_SETTINGS.get('MAX_BYTES', 32 * 1024 * 1024),
+)
+
+
+def get_etag(user, file_format):
+    return f'"{user.id}-{user.shopping_cart_version}-{file_format}"'
+
+
+def render_cached(user, file_format):
+    """Отдаёт файл списка покупок из кэша или рендерит и кэширует его.
+    Ключ кэша - (пользователь, версия списка покупок, формат), поэтому
+    любое изменение корзины делает старые файлы недостижимыми.
+    """
+    key = (user.id, user.shopping_cart_version, file_format)
+    content = artifact_cache.get(key)
+    if content is not None:
+        return (content,)
+    items = aggregate_shopping_list(user)
+    return cache_while_streaming(
+        key, SHOPPING_LIST_FORMATS[file_format].render(items)
+    )
+
+
+def cache_while_streaming(key, chunks):
+    """Отдаёт части файла клиенту и кладёт собранный файл в кэш."""
+    content = []
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        content.append(chunk)
+        yield chunk
+    artifact_cache.set(key, b''.join(content))
@@ -0,0 +1,131 @@
+from copy import copy
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import variants_generated
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCarts, Tag)
+from recipes.signals import ingredients_imported
+from users.models import Follow
+from .authentication import token_cache
+from .catalog import ingredients_catalog, tags_catalog
+from .ingredient_index import ingredient_index
+from .pagination import RECIPES_SCOPE, SUBSCRIPTIONS_SCOPE, invalidate_counts
+from .response_cache import (ALL_RECIPES, NAME_FILTERED, RECIPE_LIST,
+                             author_tag, invalidate, recipe_tag, slug_tag)
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, **kwargs):
+    # Копия фиксирует сохранённые значения до коммита.
+    ingredient_index.update(copy(instance))
+    ingredients_catalog.invalidate()
+    invalidate(ALL_RECIPES)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    ingredient_index.remove(instance.id)
+    ingredients_catalog.invalidate()
+    invalidate(ALL_RECIPES)
+
+
+@receiver(ingredients_imported)
+def ingredients_bulk_changed(sender, **kwargs):
+    ingredient_index.invalidate()
+    ingredients_catalog.invalidate()
+    invalidate(ALL_RECIPES)
+
+
+@receiver(pre_save, sender=Tag)
+def tag_renamed(sender, instance, **kwargs):
+    if instance.pk is not None:
+        invalidate(
+            *map(slug_tag, Tag.objects.filter(pk=instance.pk).values_list(
+                'slug', flat=True
+            ))
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    tags_catalog.invalidate()
+    invalidate(slug_tag(instance.slug))
+    invalidate_counts(RECIPES_SCOPE)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    invalidate(
+        recipe_tag(instance.pk), RECIPE_LIST if created else NAME_FILTERED
+    )
+    invalidate_counts(RECIPES_SCOPE)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    invalidate(recipe_tag(instance.pk), RECIPE_LIST)
+    invalidate_counts(RECIPES_SCOPE)
+
+
+@receiver(variants_generated, sender=Recipe)
+def recipe_variants_generated(sender, instance, **kwargs):
+    invalidate(recipe_tag(instance.pk))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidate(ALL_RECIPES)
+    else:
+        invalidate(recipe_tag(instance.pk), RECIPE_LIST)
+    invalidate_counts(RECIPES_SCOPE)
+
+
+@receiver(post_save, sender=AmountIngredient)
+@receiver(post_delete, sender=AmountIngredient)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate(recipe_tag(instance.recipe_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCarts)
+@receiver(post_delete, sender=ShoppingCarts)
+def user_recipes_changed(sender, instance, **kwargs):
+    invalidate_counts(RECIPES_SCOPE, instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def subscriptions_changed(sender, instance, **kwargs):
+    invalidate_counts(SUBSCRIPTIONS_SCOPE, instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    invalidate(author_tag(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(token_cache.invalidate, instance.key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_credentials_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(token_cache.invalidate_user, instance.pk))
@@ -0,0 +1,803 @@
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from foodgram.db_router import read_database
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from recipes.images import VARIANTS, generate_variants
+from recipes.management.commands.base_command import JsonArrayReader
+from recipes.models import (AmountIngredient, DataVersion, Favorite,
+                            Ingredient, Recipe, ShoppingCarts, Tag)
+from users.models import Follow
+from .authentication import token_cache
+from .catalog import ingredients_catalog, tags_catalog
+from .fields import BASE64_CHUNK_SIZE, StreamingBase64ImageField
+from .ingredient_index import ingredient_index
+from .shopping_list import aggregate_shopping_list
+from .versions import VERSION_SETTINGS
+
+User = get_user_model()
+MEDIA_ROOT = tempfile.mkdtemp()
+IMAGE = 'recipes/test.png'
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAQAAAAECAIAAAAmkwkpAAAAE'
+    'ElEQVR4nGP8z4AATAxEcQAz0QEHOoQ+uAAAAABJRU5ErkJggg=='
+)
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_data(recipes=30, authors=5, ingredients=20):
+    """Теги, ингредиенты, авторы с рецептами и пользователь, у которого
+    есть избранное, корзина и подписки.
+    У рецептов уже отмечены готовые копии фото, чтобы их не строил
+    фоновый пул.
+    """
+    tags = [
+        Tag.objects.create(
+            name=f'Тег {number}', slug=f'tag-{number}', color='#00000f'
+        )
+        for number in range(3)
+    ]
+    ingredient_list = [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        )
+        for number in range(ingredients)
+    ]
+    author_list = [
+        User.objects.create_user(
+            username=f'author{number}',
+            email=f'author{number}@foodgram.ru',
+            password='Password-123',
+            first_name='Автор',
+            last_name=str(number),
+        )
+        for number in range(authors)
+    ]
+    recipe_list = []
+    for number in range(recipes):
+        recipe = Recipe.objects.create(
+            name=f'Рецепт {number}',
+            author=author_list[number % authors],
+            image=IMAGE,
+            image_variants={'source': IMAGE},
+            text='Описание',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags[: 1 + number % len(tags)])
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(
+                recipe=recipe,
+                ingredient=ingredient_list[(number + shift) % ingredients],
+                amount=shift + 1,
+            )
+            for shift in range(3)
+        )
+        recipe_list.append(recipe)
+    user = User.objects.create_user(
+        username='user',
+        email='user@foodgram.ru',
+        password='Password-123',
+        first_name='Пользователь',
+        last_name='Тестовый',
+    )
+    for recipe in recipe_list[::2]:
+        Favorite.objects.create(user=user, recipe=recipe)
+    for recipe in recipe_list[::3]:
+        ShoppingCarts.objects.create(user=user, recipe=recipe)
+    for author in author_list[:2]:
+        Follow.objects.create(user=user, author=author)
+    return {
+        'tags': tags,
+        'ingredients': ingredient_list,
+        'authors': author_list,
+        'recipes': recipe_list,
+        'user': user,
+        'token': Token.objects.create(user=user),
+    }
+
+
+def get_client(token=None):
+    client = APIClient()
+    if token is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def get_totals(items):
+    return {(item.name, item.measurement_unit): item.amount for item in items}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ApiTestCase(TestCase):
+    """Общие данные и чистые кэши для каждого теста."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = create_data()
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        ingredients_catalog.clear()
+        tags_catalog.clear()
+        ingredient_index.clear()
+
+
+class RecipeListQueriesTest(ApiTestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def assert_list_queries(self, client, queries):
+        """Первый запрос считает рецепты, повторный берёт число из кэша
+        и обходится на запрос меньше.
+        """
+        for limit in (6, 50):
+            cache.clear()
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(queries):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), min(limit, 30))
+                with self.assertNumQueries(queries - 1):
+                    client.get(f'/api/recipes/?limit={limit}&page=1')
+
+    def test_anonymous_list_queries(self):
+        self.assert_list_queries(get_client(), 4)
+
+    def test_authenticated_list_queries(self):
+        client = get_client(self.data['token'])
+        # Токен уже в кэше аутентификации и запроса не добавляет.
+        client.get('/api/users/me/')
+        self.assert_list_queries(client, 5)
+
+    def test_authenticated_flags(self):
+        response = get_client(self.data['token']).get('/api/recipes/?limit=50')
+        results = {
+            recipe['id']: recipe for recipe in response.data['results']
+        }
+        first = results[self.data['recipes'][0].pk]
+        self.assertTrue(first['is_favorited'])
+        self.assertTrue(first['is_in_shopping_cart'])
+        self.assertTrue(first['author']['is_subscribed'])
+        second = results[self.data['recipes'][1].pk]
+        self.assertFalse(second['is_favorited'])
+        self.assertFalse(second['is_in_shopping_cart'])
+        self.assertTrue(second['author']['is_subscribed'])
+
+
+class ShoppingListAggregationTest(ApiTestCase):
+    """Список покупок совпадает с суммой, посчитанной в Python."""
+
+    CART_SIZE = 2000
+
+    def create_cart(self, buyer):
+        """Большая корзина из рецептов с ингредиентами общих рецептов.
+        Возвращает ожидаемые суммы по ингредиентам.
+        """
+        ingredients = self.data['ingredients']
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт корзины {number}',
+                author=self.data['authors'][0],
+                image=IMAGE,
+                image_variants={'source': IMAGE},
+                text='Описание',
+                cooking_time=1,
+            )
+            for number in range(self.CART_SIZE)
+        )
+        recipe_ids = list(
+            Recipe.objects.filter(name__startswith='Рецепт корзины')
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        expected = Counter()
+        amounts = []
+        for number, recipe_id in enumerate(recipe_ids):
+            for shift in range(4):
+                ingredient = ingredients[
+                    (number * 7 + shift) % len(ingredients)
+                ]
+                amount = number % 50 + shift + 1
+                amounts.append(
+                    AmountIngredient(
+                        recipe_id=recipe_id,
+                        ingredient=ingredient,
+                        amount=amount,
+                    )
+                )
+                expected[ingredient.name, ingredient.measurement_unit] += (
+                    amount
+                )
+        AmountIngredient.objects.bulk_create(amounts)
+        ShoppingCarts.objects.bulk_create(
+            ShoppingCarts(user=buyer, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        )
+        # Часть тех же рецептов лежит и в чужой корзине.
+        ShoppingCarts.objects.bulk_create(
+            ShoppingCarts(user=self.data['user'], recipe_id=recipe_id)
+            for recipe_id in recipe_ids[:100]
+        )
+        return expected
+
+    def test_large_cart_totals(self):
+        buyer = User.objects.create_user(
+            username='buyer',
+            email='buyer@foodgram.ru',
+            password='Password-123',
+            first_name='Покупатель',
+            last_name='Тестовый',
+        )
+        expected = self.create_cart(buyer)
+        # Те же ингредиенты есть в рецептах вне корзины покупателя.
+        self.assertTrue(
+            AmountIngredient.objects.exclude(recipe__carts_in__user=buyer)
+            .filter(ingredient__in=self.data['ingredients'])
+            .exists()
+        )
+        with self.assertNumQueries(1):
+            items = aggregate_shopping_list(buyer)
+        self.assertEqual(get_totals(items), expected)
+        self.assertEqual(list(items), sorted(items))
+
+    def test_cart_ignores_recipes_outside_it(self):
+        user = self.data['user']
+        expected = Counter()
+        for recipe in self.data['recipes'][::3]:
+            for amount in recipe.amount_recipe.select_related('ingredient'):
+                ingredient = amount.ingredient
+                expected[ingredient.name, ingredient.measurement_unit] += (
+                    amount.amount
+                )
+        self.assertEqual(get_totals(aggregate_shopping_list(user)), expected)
+
+    def test_empty_cart(self):
+        self.assertEqual(
+            aggregate_shopping_list(self.data['authors'][0]), ()
+        )
+
+
+class RecipeUpdateQueriesTest(ApiTestCase):
+    """Изменение рецепта пишет в базу только изменившиеся строки."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = get_client(self.data['token'])
+        self.payload = {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in self.data['ingredients'][:10]
+            ],
+            'tags': [tag.id for tag in self.data['tags']],
+            'image': PNG,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }
+        response = self.client.post(
+            '/api/recipes/', self.payload, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.url = f'/api/recipes/{response.data["id"]}/'
+
+    def get_writes(self, table):
+        """Запросы из последнего запроса к API, меняющие таблицу."""
+        writes = Counter()
+        for query in self.queries.captured_queries:
+            sql = query['sql']
+            if table in sql and sql.startswith(('INSERT', 'UPDATE', 'DELETE')):
+                writes[sql.split(maxsplit=1)[0]] += 1
+        return writes
+
+    def patch(self, payload):
+        with CaptureQueriesContext(connection) as self.queries:
+            response = self.client.patch(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_one_amount_changed(self):
+        self.payload['ingredients'][3]['amount'] = 7
+        response = self.patch(self.payload)
+        self.assertEqual(
+            self.get_writes('"recipes_amountingredient"'), Counter(UPDATE=1)
+        )
+        self.assertEqual(
+            sorted(
+                (ingredient['id'], ingredient['amount'])
+                for ingredient in response.data['ingredients']
+            ),
+            sorted(
+                (ingredient['id'], ingredient['amount'])
+                for ingredient in self.payload['ingredients']
+            ),
+        )
+
+    def test_ingredients_replaced(self):
+        self.payload['ingredients'] = self.payload['ingredients'][2:] + [
+            {'id': self.data['ingredients'][15].id, 'amount': 1}
+        ]
+        self.payload['tags'] = [self.data['tags'][0].id]
+        response = self.patch(self.payload)
+        self.assertEqual(
+            self.get_writes('"recipes_amountingredient"'),
+            Counter(DELETE=1, INSERT=1),
+        )
+        self.assertEqual(
+            sorted(
+                ingredient['id'] for ingredient in response.data['ingredients']
+            ),
+            sorted(
+                ingredient['id'] for ingredient in self.payload['ingredients']
+            ),
+        )
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], self.payload['tags']
+        )
+
+    def test_patch_without_tags_and_ingredients(self):
+        response = self.patch({'name': 'Только название'})
+        self.assertEqual(response.data['name'], 'Только название')
+        self.assertEqual(self.get_writes('"recipes_amountingredient"'), {})
+        self.assertEqual(self.get_writes('"recipes_recipe_tags"'), {})
+        self.assertEqual(
+            len(response.data['ingredients']), len(self.payload['ingredients'])
+        )
+        self.assertEqual(
+            len(response.data['tags']), len(self.payload['tags'])
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RelationToggleConcurrencyTest(TransactionTestCase):
+    """Один и тот же переключатель из многих потоков срабатывает один раз."""
+
+    THREADS = 16
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.data = create_data(recipes=6)
+
+    def hammer(self, method, url):
+        """Отправляет запрос одновременно из THREADS потоков."""
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def send():
+            client = get_client(self.data['token'])
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=send) for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return Counter(statuses)
+
+    def test_favorite(self):
+        recipe = self.data['recipes'][1]
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(
+            self.hammer('post', url), Counter({201: 1, 400: self.THREADS - 1})
+        )
+        self.assertEqual(Favorite.objects.filter(recipe=recipe).count(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(
+            self.hammer('delete', url),
+            Counter({204: 1, 400: self.THREADS - 1}),
+        )
+        self.assertFalse(Favorite.objects.filter(recipe=recipe).exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_subscribe(self):
+        author = self.data['authors'][4]
+        url = f'/api/users/{author.pk}/subscribe/'
+        self.assertEqual(
+            self.hammer('post', url), Counter({201: 1, 400: self.THREADS - 1})
+        )
+        self.assertEqual(Follow.objects.filter(author=author).count(), 1)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(
+            self.hammer('delete', url),
+            Counter({204: 1, 400: self.THREADS - 1}),
+        )
+        self.assertFalse(Follow.objects.filter(author=author).exists())
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+
+
+class IngredientIndexTest(ApiTestCase):
+    """Индекс ингредиентов меняется только после коммита."""
+
+    def setUp(self):
+        super().setUp()
+        ingredient_index.build()
+
+    def search(self, query):
+        return [ingredient.pk for ingredient in ingredient_index.search(query)]
+
+    def test_rename_applied_on_commit(self):
+        ingredient = self.data['ingredients'][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.name = 'Шафран'
+            ingredient.save()
+            # Изменения в памяти после сохранения в индекс не попадают.
+            ingredient.name = 'Несохранённое название'
+            self.assertEqual(self.search('шафран'), [])
+        self.assertEqual(self.search('шафран'), [ingredient.pk])
+        self.assertEqual(self.search('несохранённое'), [])
+        self.assertNotIn(ingredient.pk, self.search('ингредиент'))
+        self.assertEqual(
+            ingredient_index.search('шафран')[0].name, 'Шафран'
+        )
+
+    def bump_by_another_process(self, name):
+        DataVersion.objects.update_or_create(
+            name=name, defaults={'version': 'другой процесс'}
+        )
+
+    def test_rename_by_another_process(self):
+        ingredient = self.data['ingredients'][1]
+        # Другой процесс меняет строки и версию в базе, минуя сигналы
+        # этого процесса.
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='Кардамон')
+        self.bump_by_another_process(ingredient_index.version.name)
+        self.assertEqual(self.search('кардамон'), [])
+        with mock.patch.dict(VERSION_SETTINGS, CHECK_INTERVAL=0):
+            self.assertEqual(self.search('кардамон'), [ingredient.pk])
+
+    def test_rename_after_another_process(self):
+        ingredient = self.data['ingredients'][1]
+        # Другой процесс уже сменил версию: индекс не правится на месте,
+        # а перестраивается.
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='Кардамон')
+        self.bump_by_another_process(ingredient_index.version.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.data['ingredients'][2].name = 'Куркума'
+            self.data['ingredients'][2].save()
+        self.assertEqual(self.search('кардамон'), [ingredient.pk])
+        self.assertEqual(
+            self.search('куркума'), [self.data['ingredients'][2].pk]
+        )
+
+    def test_index_max_age(self):
+        ingredient = self.data['ingredients'][1]
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='Кардамон')
+        self.assertEqual(self.search('кардамон'), [])
+        with mock.patch.dict(VERSION_SETTINGS, MAX_AGE=0):
+            self.assertEqual(self.search('кардамон'), [ingredient.pk])
+
+    def test_delete_applied_on_commit(self):
+        ingredient = self.data['ingredients'][2]
+        pk = ingredient.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+            self.assertEqual(self.search('ингредиент 2'), [pk])
+        self.assertEqual(self.search('ингредиент 2'), [])
+
+
+class CatalogTest(ApiTestCase):
+    """Справочник ингредиентов: сброс после коммита и условные запросы."""
+
+    URL = '/api/ingredients/'
+
+    def get_names(self):
+        return {
+            ingredient['name']
+            for ingredient in json.loads(self.client.get(self.URL).content)
+        }
+
+    def test_rename_applied_on_commit(self):
+        ingredient = self.data['ingredients'][0]
+        self.assertIn(ingredient.name, self.get_names())
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.name = 'Шафран'
+            ingredient.save()
+            self.assertNotIn('Шафран', self.get_names())
+        self.assertIn('Шафран', self.get_names())
+
+    def test_rename_by_another_process(self):
+        ingredient = self.data['ingredients'][1]
+        self.assertIn(ingredient.name, self.get_names())
+        # Другой процесс меняет данные и версию в базе, минуя сигналы
+        # этого процесса.
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='Кардамон')
+        DataVersion.objects.update_or_create(
+            name=ingredients_catalog.version.name,
+            defaults={'version': 'другой процесс'},
+        )
+        self.assertNotIn('Кардамон', self.get_names())
+        with mock.patch.dict(VERSION_SETTINGS, CHECK_INTERVAL=0):
+            self.assertIn('Кардамон', self.get_names())
+
+    def test_snapshot_max_age(self):
+        ingredient = self.data['ingredients'][2]
+        self.assertIn(ingredient.name, self.get_names())
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='Куркума')
+        self.assertNotIn('Куркума', self.get_names())
+        with mock.patch.dict(VERSION_SETTINGS, MAX_AGE=0):
+            self.assertIn('Куркума', self.get_names())
+
+    def get_status(self, **headers):
+        return self.client.get(self.URL, **headers).status_code
+
+    def test_etag_of_negotiated_encoding(self):
+        identity = self.client.get(self.URL)['ETag']
+        gzip = self.client.get(self.URL, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertNotEqual(identity, gzip)
+        self.assertEqual(self.get_status(HTTP_IF_NONE_MATCH=gzip), 200)
+        self.assertEqual(self.get_status(HTTP_IF_NONE_MATCH=identity), 304)
+        self.assertEqual(
+            self.get_status(
+                HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzip
+            ),
+            304,
+        )
+
+
+class StreamingBase64ImageFieldTest(TestCase):
+    """Картинка из base64 декодируется кусками так же, как целиком."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Шум почти не сжимается, поэтому base64 занимает несколько кусков.
+        noise = random.Random(0).randbytes(256 * 256 * 3)
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (256, 256), noise).save(buffer, format='PNG')
+        cls.content = buffer.getvalue()
+        super().setUpClass()
+
+    def decode(self, base64_data):
+        upload = StreamingBase64ImageField().to_internal_value(base64_data)
+        try:
+            return upload.read()
+        finally:
+            upload.close()
+
+    def test_plain(self):
+        self.assertGreater(len(self.content), 2 * BASE64_CHUNK_SIZE)
+        self.assertEqual(
+            self.decode(base64.b64encode(self.content).decode()),
+            self.content,
+        )
+
+    def test_mime_wrapped(self):
+        encoded = base64.encodebytes(self.content).decode()
+        self.assertEqual(
+            self.decode(f'data:image/png;base64,{encoded}'), self.content
+        )
+        self.assertEqual(
+            self.decode(encoded.replace('\n', '\r\n ')), self.content
+        )
+
+    def test_truncated(self):
+        encoded = base64.b64encode(self.content).decode()
+        with self.assertRaises(ValidationError):
+            self.decode(encoded[:-1])
+
+
+class ReplicaLagCacheTest(ApiTestCase):
+    """Ответ и count из отстающей реплики не кешируются."""
+
+    URL = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        # Основная база играет роль реплики, чтобы запросы выполнялись.
+        self.addCleanup(read_database.reset, read_database.set('default'))
+        self.client = get_client()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.data['recipes'][-1].save()
+
+    def test_not_cached_right_after_change(self):
+        self.client.get(self.URL)
+        with self.assertNumQueries(4):
+            self.client.get(self.URL)
+
+    @override_settings(DB_REPLICA_STICKINESS=0)
+    def test_cached_after_replica_caught_up(self):
+        self.client.get(self.URL)
+        with self.assertNumQueries(0):
+            self.client.get(self.URL)
+        with self.assertNumQueries(3):
+            self.client.get(f'{self.URL}?page=1')
+
+
+class TokenCacheStatsTest(ApiTestCase):
+    """Счётчики кэша токенов доступны только персоналу."""
+
+    URL = '/api/auth/token-cache-stats/'
+
+    def test_staff_only(self):
+        self.assertEqual(get_client().get(self.URL).status_code, 401)
+        self.assertEqual(
+            get_client(self.data['token']).get(self.URL).status_code, 403
+        )
+
+    def test_counters(self):
+        staff = self.data['authors'][0]
+        staff.is_staff = True
+        staff.save()
+        client = get_client(Token.objects.create(user=staff))
+        first = client.get(self.URL).data
+        second = client.get(self.URL).data
+        self.assertEqual(second['pid'], os.getpid())
+        self.assertEqual(second['misses'], first['misses'])
+        self.assertEqual(second['hits'], first['hits'] + 1)
+        self.assertGreaterEqual(second['size'], 1)
+
+
+class ImageVariantsTest(ApiTestCase):
+    """Копии фото рецепта, в том числе AVIF, попадают в ответ."""
+
+    def test_variants_in_response(self):
+        client = get_client(self.data['token'])
+        response = client.post(
+            '/api/recipes/',
+            {
+                'ingredients': [
+                    {'id': self.data['ingredients'][0].id, 'amount': 1}
+                ],
+                'tags': [self.data['tags'][0].id],
+                'image': PNG,
+                'name': 'Рецепт с фото',
+                'text': 'Описание',
+                'cooking_time': 5,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        generate_variants(Recipe.objects.get(pk=response.data['id']))
+        data = client.get(f'/api/recipes/{response.data["id"]}/').data
+        for name in VARIANTS:
+            with self.subTest(variant=name):
+                self.assertTrue(data[name].endswith(VARIANTS[name].extension))
+
+
+class RecipeIdsTest(ApiTestCase):
+    """?ids= отдаёт рецепты без страниц, но только по непустому списку."""
+
+    URL = '/api/recipes/'
+
+    def test_ids_without_pages(self):
+        ids = [recipe.pk for recipe in self.data['recipes'][:8]]
+        response = get_client().get(
+            self.URL, {'ids': ','.join(map(str, ids))}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.data), sorted(ids)
+        )
+
+    def test_skips_empty_values(self):
+        first, second = self.data['recipes'][:2]
+        response = get_client().get(
+            self.URL, {'ids': f'{first.pk},,{second.pk},'}
+        )
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.data),
+            sorted((first.pk, second.pk)),
+        )
+
+    def test_empty_ids(self):
+        for ids in ('', ','):
+            with self.subTest(ids=ids):
+                response = get_client().get(self.URL, {'ids': ids})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.data)
+
+
+class IngredientAdminTest(ApiTestCase):
+    """Число рецептов считается только для списка ингредиентов."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(
+            User.objects.create_superuser(
+                username='admin',
+                email='admin@foodgram.ru',
+                password='Password-123',
+            )
+        )
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context]
+
+    def test_changelist_counts_recipes(self):
+        response, queries = self.get('/admin/recipes/ingredient/', o='-3')
+        self.assertTrue(any('GROUP BY' in sql for sql in queries))
+        ingredient = response.context['cl'].result_list[0]
+        self.assertEqual(
+            ingredient.recipes_count,
+            AmountIngredient.objects.filter(ingredient=ingredient).count(),
+        )
+
+    def test_autocomplete_without_counts(self):
+        response, queries = self.get(
+            '/admin/autocomplete/',
+            term='Ингредиент',
+            app_label='recipes',
+            model_name='amountingredient',
+            field_name='ingredient',
+        )
+        self.assertTrue(json.loads(response.content)['results'])
+        self.assertFalse(any('GROUP BY' in sql for sql in queries))
+
+
+class JsonArrayReaderTest(TestCase):
+    """JSON для импорта разбирается поэлементно, а не целиком."""
+
+    ROWS = [
+        {'name': 'Соль "Экстра"', 'measurement_unit': 'г'},
+        {'name': 'Молоко', 'measurement_unit': 'мл', 'fat': -1.5e-2},
+        {'name': 'Яйца', 'measurement_unit': 'шт', 'tags': [1, [2], {}]},
+    ]
+
+    def read(self, text, chunk_size):
+        return list(JsonArrayReader(io.StringIO(text), chunk_size))
+
+    def test_chunk_boundaries(self):
+        for indent in (None, 2):
+            text = json.dumps(self.ROWS, ensure_ascii=False, indent=indent)
+            for chunk_size in (1, 2, 3, 7, len(text)):
+                with self.subTest(indent=indent, chunk_size=chunk_size):
+                    self.assertEqual(self.read(text, chunk_size), self.ROWS)
+        self.assertEqual(self.read(' [ ] ', 1), [])
+
+    def test_invalid(self):
+        for text in ('', '{}', '[1,]', '[1 2]', '[1', '[1] 2', '[1.]'):
+            with self.subTest(text=text):
+                with self.assertRaises(json.JSONDecodeError):
+                    self.read(text, 1)
+
+    def test_streams(self):
+        file = io.StringIO(json.dumps(self.ROWS * 100))
+        rows = iter(JsonArrayReader(file, chunk_size=64))
+        self.assertEqual(next(rows), self.ROWS[0])
+        self.assertLess(file.tell(), len(file.getvalue()) // 50)
+
+
+@skipUnless(
+    connection.vendor in ('postgresql', 'sqlite'),
+    'Планы запросов разбираются только для PostgreSQL и SQLite.',
+)
+class QueryPlansTest(ApiTestCase):
+    """Основные эндпоинты читают горячие таблицы по индексам."""
+
+    def test_no_full_scans(self):
+        try:
+            call_command('check_query_plans', stdout=io.StringIO())
+        except CommandError as error:
+            self.fail(error)
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CustomUserViewSet, IngredientsViewSet, RecipeViewSet,
-                    TagViewSet)
+                    TagViewSet, token_cache_stats)
 
 app_name = 'api'
 
@@ -15,5 +15,10 @@ routerv_1.register('users', CustomUserViewSet, basename='users')
 
 urlpatterns = [
     path('', include(routerv_1.urls)),
+    path(
+        'auth/token-cache-stats/',
+        token_cache_stats,
+        name='token-cache-stats',
+    ),
     path('auth/', include('djoser.urls.authtoken')),
 ]
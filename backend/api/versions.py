@@ -0,0 +1,71 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from recipes.models import DataVersion
+
+VERSION_SETTINGS = getattr(settings, 'DATA_VERSIONS', {})
+
+
+class SharedVersion:
+    """Версия набора данных, общая для всех процессов: строка DataVersion.
+    Процесс перечитывает её не чаще раза в CHECK_INTERVAL секунд, так что
+    изменение из другого процесса, например из команды импорта, доходит
+    до него с этой задержкой. Версия - случайная метка, а не счётчик:
+    метка откатившейся транзакции никогда не совпадёт с записанной позже.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        # Реплика может отставать, версия читается из основной базы.
+        return DataVersion.objects.using(DEFAULT_DB_ALIAS).filter(
+            name=self.name
+        ).values_list('version', flat=True).first() or ''
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._checked_at is None
+                or now - self._checked_at
+                >= VERSION_SETTINGS.get('CHECK_INTERVAL', 5)
+            ):
+                self._version = self.read()
+                self._checked_at = now
+            return self._version
+
+    def is_current(self, version, built_at):
+        """Собранное из версии version в момент built_at ещё годится."""
+        age = time.monotonic() - built_at
+        return (
+            age < VERSION_SETTINGS.get('MAX_AGE', 600)
+            and version == self.get()
+        )
+
+    def bump(self):
+        """Меняет версию в транзакции вызывающего, возвращает старую и новую.
+        Строка блокируется до коммита, поэтому смены версии из разных
+        транзакций выстраиваются в цепочку без пропусков.
+        """
+        new = uuid.uuid4().hex
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            row, _ = DataVersion.objects.using(
+                DEFAULT_DB_ALIAS
+            ).select_for_update().get_or_create(name=self.name)
+            old = row.version
+            row.version = new
+            row.save(update_fields=['version'])
+        transaction.on_commit(self.expire, using=DEFAULT_DB_ALIAS)
+        return old, new
+
+    def expire(self):
+        """Следующий get() перечитает версию из базы."""
+        self._checked_at = None
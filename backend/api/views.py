@@ -1,38 +1,86 @@
-from http.client import BAD_REQUEST, CREATED, NO_CONTENT
-from io import BytesIO
+import os
+from contextlib import ExitStack
+from functools import partial
+from http.client import BAD_REQUEST, CREATED, NO_CONTENT, NOT_FOUND
 
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Sum
-from django.http import FileResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from foodgram.db_router import is_pinned_to_primary, use_replica
 from rest_framework import decorators, permissions, viewsets
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 
 from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
                             ShoppingCarts, Tag)
 from users.models import Follow
+from .authentication import token_cache
+from .catalog import catalog_response, ingredients_catalog, tags_catalog
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import LimitOnPagePagination
+from .ingredient_index import ingredient_index
+from .pagination import (LimitOnPageOrKeysetPagination, LimitOnPagePagination,
+                         SubscriptionsPagination)
 from .permissions import IsAuthorOrReadOnly
+from .relations import (add_relation, add_relations, remove_relation,
+                        remove_relations)
+from .response_cache import collect_tags, list_tags, recipe_response_cache
 from .serializers import (FoodgramUserSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeGetSerializer,
+                          RecipeBatchSerializer, RecipeCreateSerializer,
+                          RecipeGetSerializer,
                           RecipesForFavoriteCartFollowedSerializer,
-                          TagSerializer, UserFollowSerializer)
+                          TagSerializer, UserFollowSerializer,
+                          get_positive_int, get_recipes_limit,
+                          get_selected_fields)
+from .shopping_list import (SHOPPING_LIST_FORMATS, content_disposition,
+                            get_etag, render_cached)
 
 User = get_user_model()
-X_PCM_PDF = 100
-Y_PCM_PDF = 800
 
 
-class CustomUserViewSet(UserViewSet):
+class ReplicaReadMixin:
+    """Читает из реплик для безопасных запросов действий replica_actions.
+    Аутентификация и проверка прав идут в основную базу, а пользователь,
+    который только что изменял данные, продолжает читать из неё же.
+    """
+
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self.database_context:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not is_pinned_to_primary(request.user)
+        ):
+            self.database_context.enter_context(use_replica())
+
+
+class CustomUserViewSet(ReplicaReadMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = FoodgramUserSerializer
     pagination_class = LimitOnPagePagination
+    replica_actions = ('list',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return queryset.only(
+            *FoodgramUserSerializer.get_columns(
+                get_selected_fields(
+                    self.request, FoodgramUserSerializer.Meta.fields
+                )
+            )
+        )
 
     def get_permissions(self):
         if self.action == 'me':
@@ -46,29 +94,21 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, pk=id)
         if request.method == 'POST':
+            author = get_object_or_404(User, pk=id)
             if user == author:
                 return Response('Нельзя самоподписаться!', status=BAD_REQUEST)
-            if Follow.objects.filter(
-                user=user,
-                author=author,
-            ).exists():
-                return Response('Такая подписка уже есть!', status=BAD_REQUEST)
-            Follow.objects.create(
-                user=user,
-                author=author,
-            )
-            serializer = UserFollowSerializer(
-                author,
-                context={'request': request},
-            )
-            return Response(serializer.data, status=CREATED)
-
-        subscribe = Follow.objects.filter(author=author, user=user)
-        if subscribe.exists():
-            subscribe.delete()
+            if add_relation(Follow, user_id=user.pk, author_id=author.pk):
+                serializer = UserFollowSerializer(
+                    author,
+                    context={'request': request},
+                )
+                return Response(serializer.data, status=CREATED)
+            return Response('Такая подписка уже есть!', status=BAD_REQUEST)
+
+        if remove_relation(Follow, user_id=user.pk, author_id=id):
             return Response('Вы отписаны!', status=NO_CONTENT)
+        get_object_or_404(User, pk=id)
         return Response(
             'Нельзя отписаться, если вы ещё не подписаны!', status=BAD_REQUEST
         )
@@ -76,55 +116,196 @@ class CustomUserViewSet(UserViewSet):
     @decorators.action(
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
+        pagination_class=SubscriptionsPagination,
     )
     def subscriptions(self, request, pk=None):
         user = request.user
+        selected = get_selected_fields(
+            request, UserFollowSerializer.Meta.fields
+        )
+        queryset = User.objects.filter(following__user=user)
+        if 'is_subscribed' in selected:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author=OuterRef('pk'))
+                ),
+            )
         queryset = self.filter_queryset(
-            User.objects.filter(following__user=user)
+            queryset.only(
+                # username и id нужны курсору постраничной выдачи.
+                'username',
+                *UserFollowSerializer.get_columns(selected),
+            ).order_by(*User._meta.ordering)
         )
         page = self.paginate_queryset(queryset)
+        authors = queryset if page is None else page
+        if 'recipes' in selected:
+            self.attach_limited_recipes(authors, get_recipes_limit(request))
+        serializer = UserFollowSerializer(
+            authors,
+            many=True,
+            context={'request': request},
+        )
         if page is not None:
-            serializer = UserFollowSerializer(
-                page,
-                many=True,
-                context={'request': request},
-            )
             return self.get_paginated_response(serializer.data)
-        serializer = UserFollowSerializer(queryset, many=True)
         return Response(serializer.data)
 
+    @staticmethod
+    def attach_limited_recipes(authors, recipes_limit):
+        """Одним запросом достаёт первые recipes_limit рецептов авторов.
+        Нумерует рецепты каждого автора оконной функцией ROW_NUMBER
+        и раскладывает их по авторам в атрибут limited_recipes.
+        """
+        authors = list(authors)
+        if not authors:
+            return
+        recipes_by_author = {author.id: [] for author in authors}
+        ranked = (
+            Recipe.objects.filter(author__in=recipes_by_author)
+            .only(
+                'id',
+                'name',
+                'image',
+                'image_variants',
+                'cooking_time',
+                'author_id',
+            )
+            .annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            )
+            .order_by()
+        )
+        sql, params = ranked.query.sql_with_params()
+        if recipes_limit is None:
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked ORDER BY row_number', params
+            )
+        else:
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+                'ORDER BY row_number',
+                (*params, recipes_limit),
+            )
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = recipes_by_author[author.id]
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return catalog_response(request, tags_catalog)
+
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filteset_class = IngredientFilter
 
-    def get_queryset(self):
-        name = self.request.query_params.get('name')
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
         if not name:
-            return Ingredient.objects.all()
-        return Ingredient.objects.filter(
-            Q(name__istartswith=name)
-            | (Q(name__icontains=name) & ~Q(name__istartswith=name))
+            if request.accepted_renderer.format != 'json':
+                return super().list(request, *args, **kwargs)
+            return catalog_response(request, ingredients_catalog)
+        ingredients = ingredient_index.search(
+            name, get_positive_int(request.query_params.get('limit'))
         )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.select_related('author').all()
-    pagination_class = LimitOnPagePagination
+    pagination_class = LimitOnPageOrKeysetPagination
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return super().get_queryset()
+        selected = get_selected_fields(
+            self.request, RecipeGetSerializer.Meta.fields
+        )
+        recipes = Recipe.objects.annotate(
+            **self.get_annotations(selected)
+        ).only(
+            # pub_date нужна курсору постраничной выдачи.
+            'pub_date',
+            *RecipeGetSerializer.get_columns(selected),
+        )
+        if 'author' in selected:
+            recipes = recipes.select_related('author')
+        if 'tags' in selected:
+            recipes = recipes.prefetch_related('tags')
+        if 'ingredients' in selected:
+            recipes = recipes.prefetch_related(
+                Prefetch(
+                    'amount_recipe',
+                    queryset=AmountIngredient.objects.select_related(
+                        'ingredient'
+                    ).order_by('ingredient__name'),
+                    to_attr='amounts',
+                )
+            )
+        return recipes
+
+    def get_annotations(self, selected):
+        """Аннотации is_favorited и is_in_shopping_cart, если они выбраны."""
+        user = self.request.user
+        relations = {
+            'is_favorited': Favorite,
+            'is_in_shopping_cart': ShoppingCarts,
+        }
+        return {
+            name: (
+                Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+                if user.is_authenticated
+                else Value(False)
+            )
+            for name, model in relations.items()
+            if name in selected
+        }
+
+    def list(self, request, *args, **kwargs):
+        return recipe_response_cache.respond(
+            request,
+            partial(super().list, request, *args, **kwargs),
+            partial(list_tags, request),
+            'list',
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return recipe_response_cache.respond(
+            request,
+            partial(super().retrieve, request, *args, **kwargs),
+            lambda data: collect_tags((data,)),
+            'retrieve',
+            kwargs['pk'],
+        )
+
+    def paginate_queryset(self, queryset):
+        # ?ids= отдаёт все запрошенные рецепты одним списком без страниц,
+        # размер ответа ограничен максимальным размером пакета. Пустой
+        # список id RecipeFilter отклоняет ещё до пагинации.
+        if 'ids' in self.request.query_params:
+            return None
+        return super().paginate_queryset(queryset)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -135,26 +316,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def add_recipe(self, model, user, pk, message):
         recipe = get_object_or_404(Recipe, id=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if relation.exists():
+        if add_relation(model, user_id=user.pk, recipe_id=recipe.pk) is None:
             return Response(
                 {f'Нельзя повторно добавить рецепт в {message}'},
                 status=BAD_REQUEST,
             )
-        model.objects.create(user=user, recipe=recipe)
         serializer = RecipesForFavoriteCartFollowedSerializer(recipe)
         return Response(serializer.data, status=CREATED)
 
     def delete_recipe(self, model, user, pk, message):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if not relation.exists():
-            return Response(
-                {f'Нельзя повторно удалить рецепт из {message}'},
-                status=BAD_REQUEST,
+        if remove_relation(model, user_id=user.pk, recipe_id=pk):
+            return Response(status=NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
+        return Response(
+            {f'Нельзя повторно удалить рецепт из {message}'},
+            status=BAD_REQUEST,
+        )
+
+    def add_recipes(self, model, user, ids, message):
+        recipes = Recipe.objects.in_bulk(ids)
+        created = {
+            relation.recipe_id
+            for relation in add_relations(
+                model,
+                [
+                    {'user_id': user.pk, 'recipe_id': pk}
+                    for pk in ids
+                    if pk in recipes
+                ],
             )
-        relation.delete()
-        return Response(status=NO_CONTENT)
+        }
+        results = []
+        for pk in ids:
+            if pk not in recipes:
+                results.append({'id': pk, 'status': NOT_FOUND})
+            elif pk in created:
+                results.append(
+                    {
+                        'id': pk,
+                        'status': CREATED,
+                        'recipe': RecipesForFavoriteCartFollowedSerializer(
+                            recipes[pk]
+                        ).data,
+                    }
+                )
+            else:
+                results.append(
+                    {
+                        'id': pk,
+                        'status': BAD_REQUEST,
+                        'detail': 'Нельзя повторно добавить рецепт в '
+                        f'{message}',
+                    }
+                )
+        return Response({'results': results})
+
+    def delete_recipes(self, model, user, ids, message):
+        deleted = {
+            relation.recipe_id
+            for relation in remove_relations(
+                model, user_id=user.pk, recipe_id=ids
+            )
+        }
+        missing = set(ids) - deleted
+        if missing:
+            missing -= set(
+                Recipe.objects.filter(pk__in=missing).values_list(
+                    'pk', flat=True
+                )
+            )
+        results = []
+        for pk in ids:
+            if pk in deleted:
+                results.append({'id': pk, 'status': NO_CONTENT})
+            elif pk in missing:
+                results.append({'id': pk, 'status': NOT_FOUND})
+            else:
+                results.append(
+                    {
+                        'id': pk,
+                        'status': BAD_REQUEST,
+                        'detail': 'Нельзя повторно удалить рецепт из '
+                        f'{message}',
+                    }
+                )
+        return Response({'results': results})
+
+    def batch(self, request, model, add_message, delete_message):
+        """Пакетно добавляет или удаляет рецепты из тела {"recipes": [id]}.
+        Отвечает статусом для каждого id в том же порядке.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            return self.add_recipes(model, request.user, ids, add_message)
+        return self.delete_recipes(model, request.user, ids, delete_message)
 
     @decorators.action(
         detail=True,
@@ -182,67 +439,66 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @decorators.action(
         detail=False,
+        methods=('post', 'delete'),
+        url_path='favorite',
+        url_name='favorite-batch',
         permission_classes=(permissions.IsAuthenticated,),
     )
-    def download_shopping_cart(self, request):
-        buffer = BytesIO()
-        page = canvas.Canvas(buffer)
-        pdfmetrics.registerFont(
-            TTFont(
-                'DejaVuSerif',
-                'DejaVuSerif.ttf',
-                'UTF-8',
-            )
+    def favorite_batch(self, request):
+        return self.batch(request, Favorite, 'избранное', 'избранного')
+
+    @decorators.action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch(
+            request, ShoppingCarts, 'список покупок', 'списка покупок'
         )
-        pdfmetrics.registerFont(
-            TTFont(
-                'DejaVuSerif-Bold',
-                'DejaVuSerif-Bold.ttf',
-                'UTF-8',
+
+    def perform_content_negotiation(self, request, force=False):
+        if self.action == 'download_shopping_cart':
+            # ?format= выбирает формат списка покупок, а не рендерер DRF.
+            force = True
+        return super().perform_content_negotiation(request, force)
+
+    @decorators.action(
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get('format', 'pdf')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                'Доступные форматы: '
+                f'{", ".join(SHOPPING_LIST_FORMATS)}',
+                status=BAD_REQUEST,
             )
-        )
         file = '_shopping_list'
-
-        ingredients = (
-            AmountIngredient.objects.annotate(
-                sum_amount=Sum('ingredient__amount_ingredient__amount')
+        etag = get_etag(request.user, file_format)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = StreamingHttpResponse(
+                render_cached(request.user, file_format),
+                content_type=SHOPPING_LIST_FORMATS[file_format].content_type,
             )
-            .values(
-                'ingredient__name',
-                'ingredient__measurement_unit',
-                'sum_amount',
+            response['Content-Disposition'] = content_disposition(
+                f'{request.user.username}_{file}.{file_format}'
             )
-            .filter(recipe__carts_in__user=request.user)
-        )
-        page.setFont('DejaVuSerif-Bold', 13)
-        page.drawString(
-            X_PCM_PDF,
-            Y_PCM_PDF,
-            'Список продуктов, который Вам потребуется:',
-        )
-        y_for_string = 750
-        for number, ingredient in enumerate(ingredients, start=1):
-            page.setFont('DejaVuSerif', 10)
-            ingredients_list = (
-                f'{number}. {ingredient["ingredient__name"]}: '
-                f'{ingredient["sum_amount"]} '
-                f'{ingredient["ingredient__measurement_unit"]};'
-            )
-            page.drawString(
-                X_PCM_PDF,
-                y_for_string,
-                ingredients_list,
-            )
-            y_for_string -= 20
-            if y_for_string <= 50:
-                page.showPage()
-                y_for_string = 800
-        page.save()
-        buffer.seek(0)
-
-        response = FileResponse(
-            buffer,
-            as_attachment=True,
-            filename=f'{request.user.username}_{file}.pdf',
-        )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
+
+
+@decorators.api_view(('GET',))
+@decorators.permission_classes((permissions.IsAdminUser,))
+def token_cache_stats(request):
+    """Счётчики кэша аутентификации по токену.
+    Кэш и счётчики у каждого процесса свои, поэтому в ответе есть pid
+    процесса, который обработал запрос.
+    """
+    return Response({'pid': os.getpid(), **token_cache.stats()})
@@ -0,0 +1,89 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Псевдоним реплики, из которой читает текущий запрос, или None.
+read_database = ContextVar('read_database', default=None)
+
+
+def pin_key(user_id):
+    return f'db-pinned-to-primary:{user_id}'
+
+
+def pin_to_primary(user):
+    """Закрепляет чтение пользователя за основной базой после записи."""
+    if settings.DATABASE_REPLICAS and settings.DB_REPLICA_STICKINESS:
+        cache.set(pin_key(user.pk), True, settings.DB_REPLICA_STICKINESS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(pin_key(user.pk), False)
+
+
+def may_lag_behind(changed_at, read_at):
+    """Могло ли чтение из реплики в момент read_at не увидеть изменение,
+    закоммиченное в основной базе в момент changed_at (оба в time_ns).
+    Отставание реплики считается не больше DB_REPLICA_STICKINESS секунд.
+    Чтения из основной базы всегда видят закоммиченное.
+    """
+    return read_database.get() is not None and (
+        changed_at > read_at - settings.DB_REPLICA_STICKINESS * 10 ** 9
+    )
+
+
+@contextmanager
+def use_replica():
+    """Направляет чтения внутри блока в случайную реплику, если они есть."""
+    if not settings.DATABASE_REPLICAS:
+        yield
+        return
+    token = read_database.set(random.choice(settings.DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaRouter:
+    """Роутер: чтения внутри use_replica() идут в реплику, запись в default.
+    Реплики содержат те же данные, что и основная база, поэтому связи
+    между объектами из разных псевдонимов разрешены.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """После успешного изменяющего запроса закрепляет пользователя
+    за основной базой, чтобы он сразу видел свои изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            pin_to_primary(user)
+        return response
@@ -37,6 +37,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.db_router.PinPrimaryAfterWriteMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,25 +62,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
-if os.getenv('DEBUG') == 'True' or 'true':
+if DEBUG:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            # Тестовая база в файле, чтобы тесты с потоками видели одни
+            # и те же данные, а параллельные записи ждали блокировку.
+            'OPTIONS': {'timeout': 30},
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
         }
     }
 else:
-    DATABASE = {
-        'dafault': {
+    DATABASES = {
+        'default': {
             'ENGINE': 'django.db.backends.postgresql',
             'NAME': os.getenv('POSTGRES_DB', 'foodgram'),
             'USER': os.getenv('POSTGRES_USER', 'user_foodgram'),
-            'PASSWORD': os.getenv('POSTFRES_PASSWORD', 'password'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'password'),
             'HOST': os.getenv('DB_HOST', ''),
             'PORT': os.getenv('DB_PORT', 5432),
         }
     }
 
+# Реплики только для чтения через запятую: host или host:port PostgreSQL,
+# а для SQLite пути к файлам копий базы.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, map(str.strip, os.getenv('DB_REPLICAS', '').split(','))),
+    start=1,
+):
+    alias = f'replica_{number}'
+    if DEBUG:
+        location = {'NAME': os.path.join(BASE_DIR, replica)}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or os.getenv('DB_PORT', 5432)}
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает только из основной базы.
+# Это же наибольшее отставание реплик: ответы и count, прочитанные из
+# реплики в это время после изменения, не кешируются.
+DB_REPLICA_STICKINESS = int(os.getenv('DB_REPLICA_STICKINESS', 10))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -121,7 +153,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -144,3 +185,49 @@ DJOSER = {
         'user_create': 'api.serializers.FoodgramCreateUserSerializer',
     },
 }
+
+SHOPPING_LIST_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('SHOPPING_LIST_CACHE_MAX_ENTRIES', 512)),
+    'MAX_BYTES': int(os.getenv('SHOPPING_LIST_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+}
+
+IMAGE_PIPELINE = {
+    'WORKERS': int(os.getenv('IMAGE_PIPELINE_WORKERS', 2)),
+    'ASYNC': True,
+}
+
+IMAGE_UPLOAD = {
+    'MAX_BYTES': int(os.getenv('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)),
+    'MAX_PIXELS': int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)),
+}
+
+RECIPE_RESPONSE_CACHE = {
+    'TIMEOUT': int(os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)),
+}
+
+PAGINATION_COUNT = {
+    'TIMEOUT': int(os.getenv('PAGINATION_COUNT_TIMEOUT', 60)),
+    'ESTIMATE_THRESHOLD': int(
+        os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD', 100000)
+    ),
+}
+
+RECIPE_BATCH = {
+    'MAX_SIZE': int(os.getenv('RECIPE_BATCH_MAX_SIZE', 50)),
+}
+
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('TOKEN_AUTH_CACHE_MAX_ENTRIES', 1024)),
+    'TIMEOUT': int(os.getenv('TOKEN_AUTH_CACHE_TIMEOUT', 30)),
+    'SHARED': os.getenv('TOKEN_AUTH_CACHE_SHARED', '').lower() == 'true',
+    'SHARED_TIMEOUT': int(os.getenv('TOKEN_AUTH_CACHE_SHARED_TIMEOUT', 300)),
+}
+
+# Справочники и поисковый индекс ингредиентов собираются в памяти каждого
+# процесса. Версию данных процесс перечитывает из базы не чаще раза
+# в CHECK_INTERVAL секунд, а собранное старше MAX_AGE секунд собирает
+# заново, даже если версия не менялась.
+DATA_VERSIONS = {
+    'CHECK_INTERVAL': int(os.getenv('DATA_VERSION_CHECK_INTERVAL', 5)),
+    'MAX_AGE': int(os.getenv('DATA_VERSION_MAX_AGE', 600)),
+}
@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.forms.models import BaseInlineFormSet
 
 from .models import AmountIngredient, Ingredient, Recipe, Tag
 
@@ -8,11 +11,66 @@ admin.site.site_title = 'Портал администраторов "Foodgram"'
 admin.site.index_title = 'Добро пожаловать, на самый вкусный сайт'
 
 LIMIT_POSTS_PER_PAGE = 15
+LIMIT_INLINES_PER_PAGE = 25
 
 
-class AmountInline(admin.TabularInline):
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Формсет инлайна, который выводит связанные объекты постранично.
+    Номер страницы берётся из параметра запроса page_param, поэтому
+    сохранение формы затрагивает только объекты показанной страницы.
+    """
+
+    request = None
+    page_param = 'page'
+    per_page = LIMIT_INLINES_PER_PAGE
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            self.page = Paginator(
+                super().get_queryset(), self.per_page
+            ).get_page(
+                self.request.GET.get(self.page_param)
+                if self.request is not None
+                else None
+            )
+        return self.page.object_list
+
+    @property
+    def page_links(self):
+        """Номера страниц со строкой запроса для перехода на них."""
+        links = []
+        for number in self.page.paginator.page_range:
+            query = self.request.GET.copy()
+            query[self.page_param] = number
+            links.append((number, query.urlencode()))
+        return links
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    formset = PaginatedInlineFormSet
+    per_page = LIMIT_INLINES_PER_PAGE
+    template = 'admin/edit_inline/paginated_tabular.html'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.request = request
+        formset.per_page = self.per_page
+        formset.page_param = f'{formset.get_default_prefix()}-page'
+        return formset
+
+
+class AmountInline(PaginatedTabularInline):
     model = AmountIngredient
     extra = 3
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .select_related('ingredient', 'recipe__author')
+            .order_by('ingredient__name')
+        )
 
 
 @admin.register(Recipe)
@@ -23,7 +81,10 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_full_name',
         'pub_date',
         'get_favorite_count',
+        'in_carts_count',
     )
+    list_select_related = ('author',)
+    raw_id_fields = ('author',)
     fields = (
         (
             'name',
@@ -38,24 +99,19 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     search_fields = (
         'name',
-        'author',
+        'author__username',
         'tags__name',
     )
-    list_filter = (
-        'name',
-        'author',
-        'tags',
-    )
-    filter_horizontal = (
-        'ingredients',
-        'tags',
-    )
+    list_filter = ('tags',)
+    filter_horizontal = ('tags',)
     list_per_page = LIMIT_POSTS_PER_PAGE
+    show_full_result_count = False
 
     def get_favorite_count(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     get_favorite_count.short_description = 'Добавлен в избранное'
+    get_favorite_count.admin_order_field = 'favorites_count'
 
     def get_full_name(self, obj):
         return obj.author.first_name + ' ' + obj.author.last_name
@@ -66,15 +122,39 @@ class RecipeAdmin(admin.ModelAdmin):
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    inlines = (AmountInline,)
     list_display = (
         'name',
         'measurement_unit',
+        'get_recipes_count',
     )
-    list_filter = ('name',)
     search_fields = ('name',)
     list_editable = ('measurement_unit',)
     list_per_page = LIMIT_POSTS_PER_PAGE
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Число рецептов нужно только списку ингредиентов. Автодополнение
+        # в рецепте берёт тот же queryset, и GROUP BY по всем количествам
+        # шёл бы на каждое нажатие клавиши.
+        if self.is_changelist(request):
+            queryset = queryset.annotate(
+                recipes_count=Count('amount_ingredient')
+            )
+        return queryset
+
+    def is_changelist(self, request):
+        opts = self.model._meta
+        match = getattr(request, 'resolver_match', None)
+        return match is not None and match.url_name == (
+            f'{opts.app_label}_{opts.model_name}_changelist'
+        )
+
+    def get_recipes_count(self, obj):
+        return obj.recipes_count
+
+    get_recipes_count.short_description = 'Используется в рецептах'
+    get_recipes_count.admin_order_field = 'recipes_count'
 
 
 @admin.register(Tag)
@@ -0,0 +1,142 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps, features
+
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_SETTINGS = getattr(settings, 'IMAGE_PIPELINE', {})
+VARIANTS_DIR = 'recipes/variants'
+SOURCE_KEY = 'source'
+
+# Отправляется после записи новых копий фото в обход post_save.
+variants_generated = Signal()
+
+
+class Variant(NamedTuple):
+    """Описание уменьшенной копии фото рецепта."""
+
+    size: tuple
+    crop: bool
+    format: str
+    extension: str
+
+
+VARIANTS = {
+    'thumbnail': Variant((480, 480), True, 'JPEG', 'jpg'),
+    'thumbnail_webp': Variant((480, 480), True, 'WEBP', 'webp'),
+    'image_webp': Variant((1280, 1280), False, 'WEBP', 'webp'),
+    'image_avif': Variant((1280, 1280), False, 'AVIF', 'avif'),
+}
+Image.init()
+AVAILABLE_VARIANTS = {
+    name: variant
+    for name, variant in VARIANTS.items()
+    if variant.format in Image.SAVE
+    and (variant.format != 'WEBP' or features.check('webp'))
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=PIPELINE_SETTINGS.get('WORKERS', 2),
+    thread_name_prefix='recipe-images',
+)
+
+
+def render_variant(image, variant):
+    if variant.crop:
+        image = ImageOps.fit(image, variant.size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(variant.size, Image.LANCZOS)
+    if variant.format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, variant.format, quality=80)
+    return buffer.getvalue()
+
+
+def delete_variants(variants):
+    for name, path in variants.items():
+        if name != SOURCE_KEY:
+            default_storage.delete(path)
+
+
+def generate_variants(recipe):
+    """Создаёт уменьшенные копии фото рецепта и записывает пути к ним.
+    Копии пересоздаются, только если фото поменялось с прошлого раза.
+    """
+    source = recipe.image.name
+    if not source or recipe.image_variants.get(SOURCE_KEY) == source:
+        return recipe.image_variants
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {SOURCE_KEY: source}
+    with default_storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for name, variant in AVAILABLE_VARIANTS.items():
+            path = f'{VARIANTS_DIR}/{stem}_{name}.{variant.extension}'
+            default_storage.delete(path)
+            variants[name] = default_storage.save(
+                path, ContentFile(render_variant(image, variant))
+            )
+    updated = type(recipe).objects.filter(
+        pk=recipe.pk, image=source
+    ).update(image_variants=variants)
+    if not updated:
+        delete_variants(variants)
+        return recipe.image_variants
+    delete_variants(
+        {
+            name: path
+            for name, path in recipe.image_variants.items()
+            if path not in variants.values()
+        }
+    )
+    recipe.image_variants = variants
+    variants_generated.send(sender=type(recipe), instance=recipe)
+    return variants
+
+
+def process_recipe_image(model, pk):
+    try:
+        recipe = model.objects.filter(pk=pk).first()
+        if recipe is not None:
+            generate_variants(recipe)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', pk)
+
+
+def process_recipe_image_in_worker(model, pk):
+    try:
+        process_recipe_image(model, pk)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """После коммита отправляет фото рецепта в пул фоновой обработки."""
+    if not recipe.image or (
+        recipe.image_variants.get(SOURCE_KEY) == recipe.image.name
+    ):
+        return
+    model, pk = type(recipe), recipe.pk
+    if PIPELINE_SETTINGS.get('ASYNC', True):
+        transaction.on_commit(
+            lambda: executor.submit(process_recipe_image_in_worker, model, pk)
+        )
+    else:
+        transaction.on_commit(lambda: process_recipe_image(model, pk))
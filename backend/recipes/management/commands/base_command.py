@@ -1,26 +1,226 @@
 import csv
+import json
+import os
+import re
+import time
+from itertools import islice
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIClient
+
+User = get_user_model()
+FORMATS = ('csv', 'json')
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DELIMITERS = frozenset(' \t\n\r,]')
+
+
+class JsonArrayReader:
+    """Элементы JSON-массива верхнего уровня по одному, без чтения всего
+    файла: в памяти только текущий элемент и недочитанный кусок файла.
+    Элемент, оборванный на границе куска, разбирается заново после
+    дочитывания. Ошибки разбора - json.JSONDecodeError, как у json.load.
+    """
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size=JSON_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+
+    def __iter__(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+        else:
+            while True:
+                yield self.decode()
+                if self.expect(',]') == ']':
+                    break
+        if self.peek():
+            raise json.JSONDecodeError(
+                'Лишние данные после массива', self.buffer, self.position
+            )
+
+    def read_more(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Следующий символ после пробелов или пустая строка в конце."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self.read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f'Ожидался один из символов {chars}',
+                self.buffer,
+                self.position,
+            )
+        self.position += 1
+        return char
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+            # Число на границе куска могло оборваться: 1.|5 разобралось бы
+            # как 1. Значение принимается, только если за ним видно
+            # разделитель или файл кончился.
+            next_char = self.buffer[end:end + 1]
+            if next_char in DELIMITERS or not self.read_more():
+                self.position = end
+                return value
 
 
 class ImportCsvCommand(BaseCommand):
-    help = 'Базовые команды для загрузки данных из CSV'
+    """Базовая команда пакетной загрузки данных из CSV или JSON.
+    Читает файл потоком (JSON - массив объектов, разбираемый
+    поэлементно), убирает дубликаты в памяти и вставляет объекты
+    пачками через bulk_create(ignore_conflicts=True) в одной транзакции.
+    Подкласс задаёт model, порядок колонок CSV в fields и process_row.
+    """
+
+    help = 'Базовые команды для загрузки данных из CSV и JSON'
+    model = None
+    fields = ()
 
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str, help='Путь до файла')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество объектов в одной вставке',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.WARNING('Старт команды.'))
+        path = options['csv_file']
+        file_format = options['format'] or self.get_format(path)
+        start = time.perf_counter()
+        count_before = self.model.objects.count()
         try:
-            with open(options['csv_file'], encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    self.process_row(row)
-            self.stdout.write(self.style.SUCCESS('Данные загружены.'))
+            with open(path, encoding='utf-8') as file:
+                rows = getattr(self, f'read_{file_format}')(file)
+                with transaction.atomic():
+                    processed = self.load(rows, options['batch_size'])
         except FileNotFoundError:
-            raise CommandError(f'Файл не найден: {options["csv_file"]}')
+            raise CommandError(f'Файл не найден: {path}')
+        except (csv.Error, json.JSONDecodeError, KeyError) as error:
+            raise CommandError(f'Не удалось разобрать файл {path}: {error}')
+        created = self.model.objects.count() - count_before
+        elapsed = time.perf_counter() - start
+        self.after_import()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Данные загружены: строк {processed}, '
+                f'добавлено {created}, за {elapsed:.2f} с '
+                f'({processed / elapsed:.0f} строк/с).'
+            )
+        )
+
+    def get_format(self, path):
+        file_format = os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Неизвестный формат файла {path}, укажите --format'
+            )
+        return file_format
+
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            if row:
+                yield dict(zip(self.fields, row))
+
+    def read_json(self, file):
+        yield from JsonArrayReader(file)
+
+    def load(self, rows, batch_size):
+        seen = set()
+        processed = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return processed
+            processed += len(chunk)
+            batch = []
+            for row in chunk:
+                obj = self.process_row(row)
+                key = self.get_key(obj)
+                if key not in seen:
+                    seen.add(key)
+                    batch.append(obj)
+            self.model.objects.bulk_create(batch, ignore_conflicts=True)
+            self.stdout.write(f'Обработано строк: {processed}')
+
+    def get_key(self, obj):
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def after_import(self):
+        """Вызывается после загрузки, например для сброса кэшей."""
 
     def process_row(self, row):
         raise NotImplementedError(
             'Подкласс должен реализовывать метод process_row'
         )
+
+
+class ApiCommand(BaseCommand):
+    """Базовая команда, которая обращается к API от имени пользователя.
+    По умолчанию берёт первого пользователя с избранным, чтобы ответы
+    содержали персональные поля, или просто первого пользователя.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='email пользователя, от имени которого идут запросы',
+        )
+
+    def get_user(self, email):
+        users = User.objects.order_by('pk')
+        if email:
+            user = users.filter(email=email).first()
+        else:
+            user = (
+                users.filter(favorite__isnull=False).first() or users.first()
+            )
+        if user is None:
+            raise CommandError('Нет пользователя для запросов.')
+        return user
+
+    def get_client(self, email=None, user=None):
+        if user is None:
+            user = self.get_user(email)
+        host = settings.ALLOWED_HOSTS[0].strip().lstrip('.')
+        client = APIClient(SERVER_NAME='localhost' if host == '*' else host)
+        client.force_authenticate(user)
+        return client
@@ -0,0 +1,112 @@
+import base64
+import io
+import multiprocessing
+import random
+
+from api.fields import StreamingBase64ImageField
+from django.core.management.base import BaseCommand, CommandError
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+STATUS_FILE = '/proc/self/status'
+# Запись 5 в clear_refs сбрасывает пик RSS процесса (VmHWM) до текущего.
+CLEAR_REFS_FILE = '/proc/self/clear_refs'
+RESET_PEAK = '5'
+MEGABYTE = 1024 * 1024
+FIELDS = {
+    'Base64ImageField': Base64ImageField,
+    'StreamingBase64ImageField': StreamingBase64ImageField,
+}
+
+
+def read_memory():
+    """Текущий и пиковый RSS процесса в байтах."""
+    values = {}
+    with open(STATUS_FILE) as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            if name in ('VmRSS', 'VmHWM'):
+                values[name] = int(value.split()[0]) * 1024
+    return values['VmRSS'], values['VmHWM']
+
+
+def upload(field_class, payload, results):
+    """Разбирает одну картинку и сообщает, на сколько вырос пик RSS."""
+    rss, _ = read_memory()
+    with open(CLEAR_REFS_FILE, 'w') as file:
+        file.write(RESET_PEAK)
+    field_class().to_internal_value(payload).close()
+    _, peak = read_memory()
+    results.put(peak - rss)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пиковый RSS процесса на одну загрузку картинки в base64: '
+        'стандартное поле против потокового. Каждая загрузка идёт '
+        'в отдельном дочернем процессе, работает только на Linux.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--megapixels',
+            type=float,
+            default=2,
+            help='размер картинки из шума, PNG почти не сжимает её',
+        )
+        parser.add_argument(
+            '--wrapped',
+            action='store_true',
+            help='base64 с переносами строк, как у base64.encodebytes',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='сколько замеров делать, берётся наибольший',
+        )
+
+    def get_payload(self, megapixels, wrapped):
+        side = int((megapixels * 1_000_000) ** 0.5)
+        noise = random.Random(0).randbytes(side * side * 3)
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (side, side), noise).save(buffer, format='PNG')
+        content = buffer.getvalue()
+        encode = base64.encodebytes if wrapped else base64.b64encode
+        payload = f'data:image/png;base64,{encode(content).decode()}'
+        return len(content), payload
+
+    def measure(self, field_class, payload):
+        context = multiprocessing.get_context('fork')
+        results = context.SimpleQueue()
+        process = context.Process(
+            target=upload, args=(field_class, payload, results)
+        )
+        process.start()
+        process.join()
+        if process.exitcode or results.empty():
+            raise CommandError(
+                f'{field_class.__name__}: замер завершился с ошибкой.'
+            )
+        return results.get()
+
+    def handle(self, *args, **options):
+        try:
+            read_memory()
+        except OSError:
+            raise CommandError(f'Нет {STATUS_FILE}, нужен Linux.')
+        size, payload = self.get_payload(
+            options['megapixels'], options['wrapped']
+        )
+        self.stdout.write(
+            f'Картинка {size / MEGABYTE:.1f} МБ, '
+            f'base64 {len(payload) / MEGABYTE:.1f} МБ.'
+        )
+        for name, field_class in FIELDS.items():
+            peak = max(
+                self.measure(field_class, payload)
+                for _ in range(options['repeat'])
+            )
+            self.stdout.write(
+                f'{name}: пик RSS +{peak / MEGABYTE:.1f} МБ на загрузку'
+            )
@@ -0,0 +1,172 @@
+import base64
+import io
+import timeit
+from functools import partial
+
+from api.catalog import ingredients_catalog, tags_catalog
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import MAX_BATCH_SIZE
+from django.core.management.base import CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from recipes.management.commands.base_command import ApiCommand
+from recipes.models import Recipe
+
+MEDIA_TYPE = 'application/json'
+ENDPOINTS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=50',
+    '/api/recipes/{recipe}/',
+    '/api/users/',
+    '/api/users/subscriptions/',
+)
+# Размер картинки в теле запроса на создание рецепта.
+IMAGE_BYTES = 512 * 1024
+# Справочники отдаются готовыми байтами, поэтому их данные берутся
+# у самого справочника, а не из ответа.
+CATALOGS = {
+    '/api/ingredients/': ingredients_catalog,
+    '/api/tags/': tags_catalog,
+}
+
+
+class Command(ApiCommand):
+    help = (
+        'Сравнение стандартного и быстрого JSON на ответах основных '
+        'эндпоинтов и телах запросов: завершается ошибкой, если байты '
+        'ответа или разобранные данные расходятся.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=100,
+            help='сколько раз повторять операцию в одном замере',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='сколько замеров делать, берётся лучший',
+        )
+
+    def get_payloads(self, client, recipe):
+        for url, catalog in CATALOGS.items():
+            yield url, catalog.get_data(), {}
+        for endpoint in ENDPOINTS:
+            url = endpoint.format(recipe=recipe.pk)
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}.')
+            yield url, response.data, response.renderer_context
+
+    def measure(self, function, options):
+        """Лучшее время одного вызова в миллисекундах."""
+        return min(
+            timeit.repeat(
+                function, number=options['number'], repeat=options['repeat']
+            )
+        ) / options['number'] * 1000
+
+    def get_bodies(self, recipe):
+        """Тела типичных запросов: рецепт с картинкой и пакет id."""
+        image = base64.b64encode(bytes(IMAGE_BYTES)).decode()
+        recipe_body = {
+            'ingredients': [
+                {'id': amount.ingredient_id, 'amount': amount.amount}
+                for amount in recipe.amount_recipe.all()
+            ],
+            'tags': list(recipe.tags.values_list('id', flat=True)),
+            'image': f'data:image/png;base64,{image}',
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        batch_body = {'recipes': list(range(1, MAX_BATCH_SIZE + 1))}
+        for name, data in (('рецепт', recipe_body), ('пакет', batch_body)):
+            yield name, JSONRenderer().render(data)
+
+    def report(self, name, times):
+        standard, fast = times
+        self.stdout.write(
+            f'{name}: {standard:.3f} -> {fast:.3f} мс '
+            f'(x{standard / fast:.1f})'
+        )
+
+    def compare_render(self, url, data, context, options):
+        renderers = (JSONRenderer(), FastJSONRenderer())
+        bodies = [
+            renderer.render(data, MEDIA_TYPE, context)
+            for renderer in renderers
+        ]
+        if bodies[0] != bodies[1]:
+            self.stdout.write(
+                self.style.ERROR(f'рендер {url}: байты расходятся')
+            )
+            return False
+        self.report(
+            f'рендер {url}, {len(bodies[0])} байт',
+            [
+                self.measure(
+                    partial(renderer.render, data, MEDIA_TYPE, context),
+                    options,
+                )
+                for renderer in renderers
+            ],
+        )
+        return True
+
+    def compare_parse(self, name, body, options):
+        parsers = (JSONParser(), FastJSONParser())
+        parsed = [
+            parser.parse(io.BytesIO(body), MEDIA_TYPE) for parser in parsers
+        ]
+        if parsed[0] != parsed[1]:
+            self.stdout.write(
+                self.style.ERROR(f'разбор {name}: данные расходятся')
+            )
+            return False
+        self.report(
+            f'разбор {name}, {len(body)} байт',
+            [
+                self.measure(
+                    lambda parser=parser: parser.parse(
+                        io.BytesIO(body), MEDIA_TYPE
+                    ),
+                    options,
+                )
+                for parser in parsers
+            ],
+        )
+        return True
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    'orjson не установлен, быстрые классы работают '
+                    'через стандартный json.'
+                )
+            )
+        recipe = Recipe.objects.order_by('pk').first()
+        if recipe is None:
+            raise CommandError('Нужен хотя бы один рецепт.')
+        client = self.get_client(options['user'])
+        failures = [
+            url
+            for url, data, context in self.get_payloads(client, recipe)
+            if not self.compare_render(url, data, context, options)
+        ] + [
+            name
+            for name, body in self.get_bodies(recipe)
+            if not self.compare_parse(name, body, options)
+        ]
+        if failures:
+            raise CommandError(
+                'Быстрый JSON расходится со стандартным: '
+                f'{", ".join(failures)}'
+            )
@@ -0,0 +1,79 @@
+import time
+
+from api.shopping_list import (SHOPPING_LIST_FORMATS, aggregate_shopping_list,
+                               artifact_cache, register_fonts)
+from django.core.management.base import CommandError
+
+from recipes.management.commands.base_command import ApiCommand
+
+URL = '/api/recipes/download_shopping_cart/?format={file_format}'
+
+
+class Command(ApiCommand):
+    help = (
+        'Время ответа на скачивание списка покупок по форматам: до первого '
+        'байта и целиком. Для PDF сравнивается регистрация шрифтов на '
+        'каждый запрос, как было раньше, и один раз на процесс.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=30,
+            help='сколько запросов делать на каждый вариант',
+        )
+
+    def download(self, client, file_format):
+        """Время до первого байта и до конца ответа в миллисекундах."""
+        # Готовый файл из кэша не показал бы время рендера.
+        artifact_cache.clear()
+        start = time.perf_counter()
+        response = client.get(URL.format(file_format=file_format))
+        if response.status_code != 200:
+            raise CommandError(
+                f'{file_format}: ответ {response.status_code}.'
+            )
+        chunks = iter(response.streaming_content)
+        next(chunks, None)
+        first_byte = time.perf_counter() - start
+        for _ in chunks:
+            pass
+        return first_byte * 1000, (time.perf_counter() - start) * 1000
+
+    def measure(self, client, file_format, number, before=None):
+        """Среднее время до первого байта и до конца ответа."""
+        first_byte = total = 0
+        for _ in range(number):
+            if before is not None:
+                before()
+            times = self.download(client, file_format)
+            first_byte += times[0]
+            total += times[1]
+        return first_byte / number, total / number
+
+    def report(self, name, times):
+        first_byte, total = times
+        self.stdout.write(
+            f'{name}: первый байт {first_byte:.1f} мс, '
+            f'целиком {total:.1f} мс'
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        client = self.get_client(user=user)
+        items = len(aggregate_shopping_list(user))
+        if not items:
+            raise CommandError(f'Список покупок {user.email} пуст.')
+        self.stdout.write(f'{user.email}: ингредиентов в списке {items}.')
+        number = options['number']
+        self.report(
+            'pdf, шрифты на каждый запрос (до)',
+            self.measure(client, 'pdf', number, register_fonts.cache_clear),
+        )
+        register_fonts()
+        for file_format in SHOPPING_LIST_FORMATS:
+            self.report(
+                file_format, self.measure(client, file_format, number)
+            )
@@ -0,0 +1,118 @@
+import re
+from contextlib import contextmanager
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from recipes.management.commands.base_command import ApiCommand
+from recipes.models import Recipe, Tag
+
+ENDPOINTS = (
+    '/api/recipes/',
+    '/api/recipes/?cursor=',
+    '/api/recipes/?tags={tag}',
+    '/api/recipes/?author={author}',
+    '/api/recipes/?is_favorited=1',
+    '/api/recipes/?is_in_shopping_cart=1',
+    '/api/recipes/{recipe}/',
+    '/api/users/subscriptions/',
+    '/api/users/subscriptions/?cursor=',
+)
+HOT_TABLES = frozenset(
+    (
+        'recipes_recipe',
+        'recipes_recipe_tags',
+        'recipes_amountingredient',
+        'recipes_favorite',
+        'recipes_shoppingcarts',
+        'users_follow',
+    )
+)
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)( USING)?')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def postgresql_seq_scans(plan):
+    """Таблицы, которые план PostgreSQL читает последовательным сканом."""
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for subplan in plan.get('Plans', ()):
+        yield from postgresql_seq_scans(subplan)
+
+
+def full_scans(sql, params):
+    """Таблицы, которые запрос читает целиком, а не по индексу."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Без seqscan планировщик выберет индекс, если он подходит,
+            # и последовательный скан останется только при его отсутствии.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return set(postgresql_seq_scans(cursor.fetchone()[0][0]['Plan']))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = cursor.fetchall()
+    # SCAN без индекса читает таблицу целиком. SCAN по индексу читает
+    # её целиком, только если сортировку всё равно делает временное дерево.
+    sorted_in_memory = any(
+        parent == 0 and detail == SQLITE_SORT for _, parent, _, detail in plan
+    )
+    return {
+        match.group(1)
+        for *_, detail in plan
+        if (match := SQLITE_SCAN.match(detail))
+        and (sorted_in_memory or not match.group(2))
+    }
+
+
+@contextmanager
+def record_queries(queries):
+    def wrapper(execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+class Command(ApiCommand):
+    help = (
+        'Проверка планов запросов основных эндпоинтов: завершается '
+        'ошибкой, если горячая таблица читается без индекса.'
+    )
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('pk').first()
+        tag = Tag.objects.order_by('pk').first()
+        if recipe is None or tag is None:
+            raise CommandError('Нужен хотя бы один рецепт и один тег.')
+        client = self.get_client(options['user'])
+        failures = []
+        for endpoint in ENDPOINTS:
+            url = endpoint.format(
+                recipe=recipe.pk, author=recipe.author_id, tag=tag.slug
+            )
+            queries = []
+            with record_queries(queries):
+                response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}.')
+            scans = set()
+            with transaction.atomic():
+                for sql, params in queries:
+                    scans |= full_scans(sql, params) & HOT_TABLES
+            if scans:
+                failures.append(url)
+                self.stdout.write(
+                    self.style.ERROR(
+                        f'{url}: запросов {len(queries)}, полное чтение '
+                        f'{", ".join(sorted(scans))}'
+                    )
+                )
+            else:
+                self.stdout.write(f'{url}: запросов {len(queries)}, ок')
+        if failures:
+            raise CommandError(
+                f'Запросы без индекса у эндпоинтов: {", ".join(failures)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы.'))
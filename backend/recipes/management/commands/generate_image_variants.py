@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import SOURCE_KEY, generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий фото для уже загруженных рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды.'))
+        processed = failed = 0
+        for recipe in Recipe.objects.exclude(image='').iterator():
+            if options['force']:
+                recipe.image_variants.pop(SOURCE_KEY, None)
+            try:
+                generate_variants(recipe)
+                processed += 1
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Обработано рецептов: {processed}, с ошибками: {failed}.'
+            )
+        )
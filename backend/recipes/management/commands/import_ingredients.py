@@ -1,11 +1,18 @@
 from recipes.management.commands.base_command import ImportCsvCommand
 from recipes.models import Ingredient
+from recipes.signals import ingredients_imported
 
 
 class Command(ImportCsvCommand):
-    help = 'Импорт ингредиентов из файла CSV.'
+    help = 'Импорт ингредиентов из файла CSV или JSON.'
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
 
     def process_row(self, row):
-        Ingredient.objects.get_or_create(
-            name=row['абрикосовое варенье'], measurement_unit=row['г']
+        return Ingredient(
+            name=row['name'].strip(),
+            measurement_unit=row['measurement_unit'].strip(),
         )
+
+    def after_import(self):
+        ingredients_imported.send(sender=Ingredient)
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCarts
+from users.models import Follow
+
+User = get_user_model()
+
+# Модель, поле счётчика, модель связей и поле связи с моделью счётчика.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCarts, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def actual_count(related_model, related_field):
+    """Выражение с фактическим количеством связанных строк."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{related_field: OuterRef('pk')})
+            .order_by()
+            .values(related_field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверка денормализованных счётчиков с фактическими данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды.'))
+        for model, field, related_model, related_field in COUNTERS:
+            actual = actual_count(related_model, related_field)
+            with transaction.atomic():
+                drifted = model.objects.annotate(actual=actual).exclude(
+                    **{field: F('actual')}
+                )
+                if options['dry_run']:
+                    fixed = drifted.count()
+                else:
+                    fixed = model.objects.filter(
+                        pk__in=drifted.values('pk')
+                    ).update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'расхождений {fixed}.'
+            )
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
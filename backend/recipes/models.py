@@ -4,6 +4,8 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from users.models import CountersMixin
+
 MAX_LENGTH_CHARFIELD = 200
 MAX_LENGTH_FOR_HEX = 7
 User = get_user_model()
@@ -64,9 +66,10 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
     name = models.CharField(
         verbose_name='Название',
         max_length=MAX_LENGTH_CHARFIELD,
@@ -81,6 +84,12 @@ class Recipe(models.Model):
         verbose_name='Фото блюда',
         upload_to='recipes/',
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -114,11 +123,31 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлен в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлен в списки покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.pub_date} {self.author} добавил рецепт {self.name}'
@@ -191,6 +220,12 @@ class Favorite(models.Model):
                 name='unique_recipe_for_favorites',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favorite_recipe_user_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} понравился {self.recipe}'
@@ -222,6 +257,38 @@ class ShoppingCarts(models.Model):
                 name='unique_recipe_for_carts',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='carts_recipe_user_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в список покупок {self.recipe}'
+
+
+class DataVersion(models.Model):
+    """Версия данных, которые процессы держат собранными в памяти.
+    Меняется в той же транзакции, что и сами данные, поэтому процесс,
+    увидевший новую версию, видит и новые строки. Одна строка на набор
+    данных, общая для веб-процессов и команд управления.
+    """
+
+    name = models.CharField(
+        verbose_name='Набор данных',
+        max_length=MAX_LENGTH_CHARFIELD,
+        unique=True,
+    )
+    version = models.CharField(
+        verbose_name='Версия',
+        max_length=32,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
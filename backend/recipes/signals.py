@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.signals import change_counters
+from .images import delete_variants, schedule_variants
+from .models import Favorite, Ingredient, Recipe, ShoppingCarts
+
+User = get_user_model()
+
+# Отправляется после массовой загрузки ингредиентов в обход post_save.
+ingredients_imported = Signal()
+
+
+def bump_shopping_cart_version(users):
+    """Меняет версию списка покупок, сбрасывая его закэшированные файлы."""
+    users.update(shopping_cart_version=F('shopping_cart_version') + 1)
+
+
+@receiver(post_save, sender=ShoppingCarts)
+@receiver(post_delete, sender=ShoppingCarts)
+def shopping_cart_changed(sender, instance, **kwargs):
+    bump_shopping_cart_version(User.objects.filter(pk=instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_shopping_cart_version(
+            User.objects.filter(carts__recipe=instance)
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_shopping_cart_version(
+            User.objects.filter(carts__recipe__ingredients=instance)
+        )
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(
+            Recipe.objects.filter(pk=instance.recipe_id), 1, 'favorites_count'
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counters(
+        Recipe.objects.filter(pk=instance.recipe_id), -1, 'favorites_count'
+    )
+
+
+@receiver(post_save, sender=ShoppingCarts)
+def shopping_cart_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(
+            Recipe.objects.filter(pk=instance.recipe_id), 1, 'in_carts_count'
+        )
+
+
+@receiver(post_delete, sender=ShoppingCarts)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    change_counters(
+        Recipe.objects.filter(pk=instance.recipe_id), -1, 'in_carts_count'
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(
+            User.objects.filter(pk=instance.author_id), 1, 'recipes_count'
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    delete_variants(instance.image_variants)
+    change_counters(
+        User.objects.filter(pk=instance.author_id), -1, 'recipes_count'
+    )
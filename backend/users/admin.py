@@ -12,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         'last_name',
         'username',
         'email',
+        'recipes_count',
+        'followers_count',
     )
     list_editable = (
         'first_name',
@@ -22,12 +24,12 @@ class UserAdmin(admin.ModelAdmin):
         'email',
     )
     list_filter = (
-        'email',
-        'username',
-        'first_name',
+        'is_staff',
+        'is_active',
     )
     list_display_links = (
         'username',
         'email',
     )
     list_per_page = LIMIT_POSTS_PER_PAGE
+    show_full_result_count = False
@@ -9,9 +9,37 @@ MAX_LENGTH_STRING_FOR_USER = 150
 MAX_LENGTH_EMAIL = 254
 
 
-class FoodgramUser(AbstractUser):
+class CountersMixin:
+    """Не даёт обычному save() затереть счётчики модели.
+    Счётчики из counter_fields меняются только атомарными UPDATE с F(),
+    поэтому при сохранении уже существующего объекта они исключаются
+    из update_fields, и устаревшие значения в памяти не попадают в базу.
+    Отложенные поля, как и в обычном save(), не сохраняются.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class FoodgramUser(CountersMixin, AbstractUser):
     """Модель пользователя для приложения."""
 
+    counter_fields = (
+        'shopping_cart_version',
+        'recipes_count',
+        'followers_count',
+    )
     first_name = models.CharField(
         verbose_name='Имя',
         max_length=MAX_LENGTH_STRING_FOR_USER,
@@ -42,6 +70,21 @@ class FoodgramUser(AbstractUser):
         unique=True,
         validators=(validate_email,),
     )
+    shopping_cart_version = models.PositiveIntegerField(
+        verbose_name='Версия списка покупок',
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('username',)
@@ -84,6 +127,12 @@ class Follow(models.Model):
                 name='unique_follow',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='follow_user_author_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'Пользователь {self.user} подписался на {self.author}'
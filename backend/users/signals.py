@@ -0,0 +1,32 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, FoodgramUser
+
+
+def change_counters(queryset, delta, *fields):
+    """Атомарно сдвигает счётчики на delta одним UPDATE, не ниже нуля."""
+    queryset.update(
+        **{field: Greatest(F(field) + delta, 0) for field in fields}
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(
+            FoodgramUser.objects.filter(pk=instance.author_id),
+            1,
+            'followers_count',
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_counters(
+        FoodgramUser.objects.filter(pk=instance.author_id),
+        -1,
+        'followers_count',
+    )